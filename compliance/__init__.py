@@ -2,19 +2,25 @@
 from __future__ import annotations
 
 import os
+from datetime import datetime
+
 import click
 from flask import Flask, g, request, redirect, url_for
-from flasgger import Swagger
 from flask_migrate import Migrate
 
 from .config import load_config
 from .models import db
-from .routes import views, engineer, manager, admin, auth
-from .seed import seed_data
 from .auth_utils import current_token_payload
 
+# Paths exempt from the login redirect; tuple form makes startswith a single C call.
+_AUTH_EXEMPT_PREFIXES = ("/auth", "/static", "/apidocs", "/apispec_1.json")
+
 
 def create_app(config_override: dict | None = None):
+    # Heavy imports deferred so `flask --help` / worker fork don't pay for them.
+    from flasgger import Swagger
+    from .routes import views, engineer, manager, admin, auth
+
     app = Flask(__name__, template_folder="templates", static_folder="static")
 
     # --- Config ---
@@ -32,8 +38,45 @@ def create_app(config_override: dict | None = None):
     if config_override:
         cfg.update(config_override)
 
+    # Tune the connection pool for MySQL/RDS: the default pool of 5 saturates
+    # easily, idle kills drop connections without recycle, and pre_ping avoids
+    # serving a dead connection after a failover. SQLite (tests/dev) keeps the
+    # library defaults since these options don't apply to its pooling.
+    if str(cfg.get("SQLALCHEMY_DATABASE_URI", "")).startswith("mysql"):
+        cfg.setdefault("SQLALCHEMY_ENGINE_OPTIONS", {
+            "pool_size": 20,
+            "max_overflow": 30,
+            "pool_recycle": 1800,
+            "pool_pre_ping": True,
+            # Room for every hot statement variant in the compiled cache
+            "query_cache_size": 1200,
+        })
+
     app.config.from_mapping(cfg)
 
+    # Snapshot S3 settings into s3util module globals so upload/presign
+    # calls don't go through current_app's LocalProxy per operation.
+    from . import s3util
+    s3util.configure(app)
+
+    # jsonify sorts keys by default; insertion order is already stable in our
+    # response dicts and skipping the sort saves work on every JSON response.
+    app.json.sort_keys = False
+
+    # Persist compiled templates across process restarts: each worker loads
+    # the cached bytecode instead of recompiling every template on its first
+    # render. Outside debug, also skip the per-render mtime stat. The cache
+    # lives under the instance path, not the world-writable system temp dir
+    # — cached bytecode is loaded as code, so the directory must not be
+    # writable by other local users.
+    from jinja2 import FileSystemBytecodeCache
+
+    _jinja_cache_dir = os.path.join(app.instance_path, "jinja-cache")
+    os.makedirs(_jinja_cache_dir, mode=0o700, exist_ok=True)
+    app.jinja_options["bytecode_cache"] = FileSystemBytecodeCache(directory=_jinja_cache_dir)
+    if not app.debug:
+        app.jinja_options["auto_reload"] = False
+
     # --- Extensions ---
     db.init_app(app)
     Migrate(app, db)  # enables: flask db init/migrate/upgrade
@@ -51,6 +94,21 @@ def create_app(config_override: dict | None = None):
         "specs_route": "/apidocs",
     })
 
+    # flasgger re-introspects every blueprint on each /apispec_1.json hit;
+    # the spec is static once routes are registered, so serve a cached copy.
+    _spec_view = app.view_functions["flasgger.apispec_1"]
+    _spec_cache: dict = {}
+
+    def _cached_apispec(*args, **kwargs):
+        if "body" not in _spec_cache:
+            resp = _spec_view(*args, **kwargs)
+            _spec_cache["body"] = resp.get_data()
+            _spec_cache["mimetype"] = resp.mimetype
+        from flask import Response
+        return Response(_spec_cache["body"], mimetype=_spec_cache["mimetype"])
+
+    app.view_functions["flasgger.apispec_1"] = _cached_apispec
+
     # --- Blueprints ---
     app.register_blueprint(auth.bp)                    # /auth/*
     app.register_blueprint(views.bp)                   # /
@@ -61,7 +119,14 @@ def create_app(config_override: dict | None = None):
     # --- Request hook: attach user info + gentle redirect to login for HTML pages ---
     @app.before_request
     def attach_user():
+        # One timestamp per request: routes that write several rows (ORM +
+        # audit) share it instead of re-reading the clock, so related rows
+        # carry identical timestamps.
+        g.now = datetime.utcnow()
+        g.today = g.now.date()
+
         payload = current_token_payload()
+        g._jwt_payload = payload
         if payload:
             g.user_id = payload.get("uid")
             g.role = payload.get("role")
@@ -72,16 +137,28 @@ def create_app(config_override: dict | None = None):
             g.user_email = None
 
         # If not authenticated and requesting HTML, send to login (allow auth/static/docs)
-        path = request.path or ""
-        wants_html = "text/html" in (request.headers.get("Accept", "") or "")
-        if (g.user_id is None) and request.method == "GET" and wants_html:
-            if not (
-                path.startswith("/auth")
-                or path.startswith("/static")
-                or path.startswith("/apidocs")
-                or path.startswith("/apispec_1.json")
-            ):
-                return redirect(url_for("auth.login_form"))
+        if g.user_id is None and request.method == "GET":
+            path = request.path or ""
+            if not path.startswith(_AUTH_EXEMPT_PREFIXES):
+                # Werkzeug caches the parsed Accept header on the request;
+                # best_match also respects q-values (a JSON-preferring client
+                # with "text/html;q=0.1" no longer gets redirected), and a
+                # bare "*/*" resolves to JSON so API clients see 401 not 302.
+                wants_html = (
+                    request.accept_mimetypes.best_match(
+                        ("application/json", "text/html")
+                    ) == "text/html"
+                )
+                if wants_html:
+                    return redirect(url_for("auth.login_form"))
+
+    # audit() only queues rows on the session; most routes sweep them up in
+    # their own business commit. This hook catches the rest so a request
+    # never fsyncs once per audited action.
+    @app.teardown_request
+    def flush_pending_audits(exc):
+        if exc is None and g.get("_audit_pending"):
+            db.session.commit()
 
     # --- Template globals for navbar/visibility toggles ---
     @app.context_processor
@@ -102,6 +179,7 @@ def create_app(config_override: dict | None = None):
     @app.cli.command("seed")
     def seed_cmd():
         """Load seed data (users, labs, courses, etc.)."""
+        from .seed import seed_data
         with app.app_context():
             seed_data()
         click.echo("Seed data inserted.")
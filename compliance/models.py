@@ -1,10 +1,18 @@
-﻿from datetime import datetime, date
+﻿import os
+from datetime import datetime, date
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import UniqueConstraint, CheckConstraint
+from sqlalchemy import UniqueConstraint, CheckConstraint, event, or_
 from werkzeug.security import generate_password_hash, check_password_hash
 
+from compliance.utils_date import add_months
+
 db = SQLAlchemy()
 
+# Explicit KDF so hashing cost is a deliberate choice rather than whatever the
+# installed Werkzeug defaults to; override via env to dial cost up/down
+# (e.g. cheaper iterations for dev seeding or test runs).
+PASSWORD_HASH_METHOD = os.getenv("PASSWORD_HASH_METHOD", "pbkdf2:sha256:260000")
+
 # ------------------------------
 # Core reference entities
 # ------------------------------
@@ -16,10 +24,10 @@ class Engineer(db.Model):
     name = db.Column(db.String(255), nullable=False)
     email = db.Column(db.String(255), unique=True, nullable=False, index=True)
 
-    # relationships (optional)
-    completions = db.relationship("Completion", backref="engineer", lazy="dynamic")
-    accesses = db.relationship("LabAccess", backref="engineer", lazy="dynamic")
-    doc_acks = db.relationship("DocumentAck", backref="engineer", lazy="dynamic")
+    # relationships (optional); list-shaped ones load via selectin to avoid N+1
+    completions = db.relationship("Completion", back_populates="engineer")
+    accesses = db.relationship("LabAccess", back_populates="engineer")
+    doc_acks = db.relationship("DocumentAck", back_populates="engineer", lazy="selectin")
 
     def __repr__(self) -> str:
         return f"<Engineer {self.id} {self.name}>"
@@ -32,9 +40,17 @@ class Lab(db.Model):
     name = db.Column(db.String(255), nullable=False)
     grace_days = db.Column(db.Integer, default=0, nullable=False)
 
-    requirements = db.relationship("LabRequirement", backref="lab", lazy="dynamic")
-    documents = db.relationship("Document", backref="lab", lazy="dynamic")
-    metrics = db.relationship("LabMetrics", backref="lab", lazy="dynamic")
+    # Denormalized copy of the newest LabMetrics row (maintained by the
+    # event listener below) so dashboards read one Lab row instead of
+    # scanning/sorting the metrics history per lab.
+    latest_asof = db.Column(db.Date, nullable=True)
+    latest_utilization = db.Column(db.Integer, nullable=True)
+    latest_condition = db.Column(db.Integer, nullable=True)
+    latest_activity = db.Column(db.Integer, nullable=True)
+
+    requirements = db.relationship("LabRequirement", back_populates="lab", lazy="selectin")
+    documents = db.relationship("Document", back_populates="lab")
+    metrics = db.relationship("LabMetrics", back_populates="lab")
 
     def __repr__(self) -> str:
         return f"<Lab {self.code}>"
@@ -48,8 +64,8 @@ class Course(db.Model):
     # default validity in months (can be overridden per lab in LabRequirement.valid_months)
     valid_months = db.Column(db.Integer, nullable=True)
 
-    completions = db.relationship("Completion", backref="course", lazy="dynamic")
-    requirements = db.relationship("LabRequirement", backref="course", lazy="dynamic")
+    completions = db.relationship("Completion", back_populates="course")
+    requirements = db.relationship("LabRequirement", back_populates="course", lazy="selectin")
 
     def __repr__(self) -> str:
         return f"<Course {self.code}>"
@@ -68,6 +84,9 @@ class LabRequirement(db.Model):
     course_id = db.Column(db.Integer, db.ForeignKey("course.id"), nullable=False)
     valid_months = db.Column(db.Integer, nullable=True)
 
+    lab = db.relationship("Lab", back_populates="requirements")
+    course = db.relationship("Course", back_populates="requirements")
+
     __table_args__ = (
         UniqueConstraint("lab_id", "course_id", name="uq_lab_course"),
     )
@@ -82,17 +101,47 @@ class Completion(db.Model):
     engineer_id = db.Column(db.Integer, db.ForeignKey("engineer.id"), nullable=False, index=True)
     course_id = db.Column(db.Integer, db.ForeignKey("course.id"), nullable=False, index=True)
     date_taken = db.Column(db.Date, nullable=False)
+    # Denormalized date_taken + course.valid_months, stamped at write time
+    # (event listener below) so the home page and expiry reports read it
+    # instead of re-deriving month arithmetic per row. NULL = never expires.
+    due_date = db.Column(db.Date, nullable=True, index=True)
 
     certificate_url = db.Column(db.String(1024), nullable=True)
 
     # Map the Python attribute `s3_key` to the existing DB column `certificate_s3_key`
     s3_key = db.Column("certificate_s3_key", db.String(1024), nullable=True)
 
+    engineer = db.relationship("Engineer", back_populates="completions")
+    course = db.relationship("Course", back_populates="completions")
+
     __table_args__ = (
         UniqueConstraint("engineer_id", "course_id", "date_taken", name="uq_completion_once_per_day"),
+        # Serves "latest completion per engineer" ordering without a sort
+        db.Index("ix_completion_engineer_date", "engineer_id", "date_taken"),
+        # Lets MAX(date_taken) GROUP BY (engineer_id, course_id) run as an
+        # index-only scan.
+        db.Index("ix_completion_pair_date", "engineer_id", "course_id", "date_taken"),
+        # completions_all orders the whole table by date_taken DESC
+        db.Index("ix_completion_date", "date_taken"),
     )
 
 
+@event.listens_for(Completion, "before_insert")
+@event.listens_for(Completion, "before_update")
+def _stamp_completion_due_date(mapper, connection, target):
+    """Keep the denormalized due_date in sync with date_taken + validity."""
+    course_tbl = Course.__table__
+    months = connection.execute(
+        course_tbl.select()
+        .with_only_columns(course_tbl.c.valid_months)
+        .where(course_tbl.c.id == target.course_id)
+    ).scalar()
+    if months and months > 0:
+        target.due_date = add_months(target.date_taken, int(months))
+    else:
+        target.due_date = None
+
+
 class Document(db.Model):
     __tablename__ = "document"
     id = db.Column(db.Integer, primary_key=True)
@@ -101,7 +150,9 @@ class Document(db.Model):
     version = db.Column(db.Integer, default=1, nullable=False)
     mandatory = db.Column(db.Boolean, default=True, nullable=False)
     s3_key = db.Column(db.String(1024), nullable=True)
-    uploaded_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    uploaded_at = db.Column(db.DateTime, server_default=db.func.now(), nullable=False)
+
+    lab = db.relationship("Lab", back_populates="documents")
 
     __table_args__ = (
         UniqueConstraint("lab_id", "title", "version", name="uq_doc_lab_title_version"),
@@ -116,6 +167,8 @@ class DocumentAck(db.Model):
     version = db.Column(db.Integer, nullable=False)
     acked_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
 
+    engineer = db.relationship("Engineer", back_populates="doc_acks")
+
     __table_args__ = (
         UniqueConstraint("engineer_id", "document_id", "version", name="uq_ack_one_per_version"),
     )
@@ -130,13 +183,26 @@ class LabAccess(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     engineer_id = db.Column(db.Integer, db.ForeignKey("engineer.id"), nullable=False, index=True)
     lab_id = db.Column(db.Integer, db.ForeignKey("lab.id"), nullable=False, index=True)
-    status = db.Column(db.String(16), nullable=False, index=True)  # pending | active | revoked
+    status = db.Column(db.String(16), nullable=False)  # pending | active | revoked
     reason_code = db.Column(db.String(64), nullable=True)  # ADDED: tracks reason for status
-    effective_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    effective_at = db.Column(db.DateTime, server_default=db.func.now(), nullable=False)
+    # Compliance flag as of the last autocheck run, so read paths can serve
+    # it with a plain SELECT instead of recomputing per pair.
+    compliant_cached = db.Column(db.Boolean, nullable=True)
+    compliant_asof = db.Column(db.Date, nullable=True)
+
+    engineer = db.relationship("Engineer", back_populates="accesses")
 
     __table_args__ = (
         UniqueConstraint("engineer_id", "lab_id", "status", name="uq_access_unique_state"),
         CheckConstraint("status in ('pending','active','revoked')", name="ck_access_status"),
+        # Composite indexes for the hot "status for engineer/lab" lookups;
+        # they cover the old single-column status index as a prefix.
+        db.Index("ix_lab_access_lab_status", "lab_id", "status"),
+        db.Index("ix_lab_access_engineer_status", "engineer_id", "status"),
+        # The CSV reports filter on status and order by effective_at DESC;
+        # this index serves that without a filesort.
+        db.Index("ix_lab_access_status_effat", "status", "effective_at"),
     )
 
 
@@ -144,19 +210,44 @@ class LabMetrics(db.Model):
     __tablename__ = "lab_metrics"
     id = db.Column(db.Integer, primary_key=True)
     lab_id = db.Column(db.Integer, db.ForeignKey("lab.id"), nullable=False, index=True)
-    asof = db.Column(db.Date, default=date.today, nullable=False, index=True)
+    asof = db.Column(db.Date, default=date.today, nullable=False)
 
     utilization = db.Column(db.Integer, nullable=False)  # 0-100
     condition   = db.Column(db.Integer, nullable=False)  # 0-100
     activity    = db.Column(db.Integer, nullable=False)  # 0-100
 
+    lab = db.relationship("Lab", back_populates="metrics")
+
     __table_args__ = (
         UniqueConstraint("lab_id", "asof", name="uq_lab_metrics_daily"),
+        # Covering index so "today's metrics" reads are served from the index
+        # alone (replaces the old single-column asof index, which it prefixes).
+        db.Index("ix_lab_metrics_today", "asof", "lab_id",
+                 "utilization", "condition", "activity"),
         CheckConstraint("utilization >= 0 AND utilization <= 100", name="ck_util_pct"),
         CheckConstraint("`condition` >= 0 AND `condition` <= 100", name="ck_cond_pct"),
         CheckConstraint("activity >= 0 AND activity <= 100", name="ck_act_pct"),
     )
 
+
+@event.listens_for(LabMetrics, "after_insert")
+@event.listens_for(LabMetrics, "after_update")
+def _refresh_lab_latest_metrics(mapper, connection, target):
+    """Keep the denormalized latest-metrics columns on Lab up to date."""
+    lab_tbl = Lab.__table__
+    connection.execute(
+        lab_tbl.update()
+        .where(lab_tbl.c.id == target.lab_id)
+        .where(or_(lab_tbl.c.latest_asof.is_(None),
+                   lab_tbl.c.latest_asof <= target.asof))
+        .values(
+            latest_asof=target.asof,
+            latest_utilization=target.utilization,
+            latest_condition=target.condition,
+            latest_activity=target.activity,
+        )
+    )
+
 # ------------------------------
 # Auth / Users
 # ------------------------------
@@ -171,7 +262,7 @@ class User(db.Model):
     engineer_id = db.Column(db.Integer, db.ForeignKey("engineer.id"), nullable=True)
 
     def set_password(self, raw: str):
-        self.pass_hash = generate_password_hash(raw)
+        self.pass_hash = generate_password_hash(raw, method=PASSWORD_HASH_METHOD)
 
     def check_password(self, raw: str) -> bool:
         return check_password_hash(self.pass_hash, raw)
@@ -183,10 +274,12 @@ class User(db.Model):
 class AuditLog(db.Model):
     __tablename__ = "audit_log"
     id = db.Column(db.Integer, primary_key=True)
-    at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+    at = db.Column(db.DateTime, server_default=db.func.now(), nullable=False, index=True)
     actor_user_id = db.Column(db.Integer, nullable=True, index=True)
     action = db.Column(db.String(64), nullable=False, index=True)   # e.g. approve_access
     entity = db.Column(db.String(64), nullable=False, index=True)   # e.g. lab_access, course, document
     entity_id = db.Column(db.String(128), nullable=True, index=True)
-    meta_json = db.Column(db.Text, nullable=True)
+    # Native JSON (JSONB on Postgres, JSON on MySQL) so meta is stored
+    # structured and subkeys stay queryable; None stays SQL NULL.
+    meta_json = db.Column(db.JSON(none_as_null=True), nullable=True)
 
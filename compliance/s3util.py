@@ -1,38 +1,70 @@
 # s3util.py
 import io
+import time
+from functools import lru_cache
 from typing import Optional
 import boto3
+from boto3.s3.transfer import TransferConfig
 from flask import current_app
 
+# Module-level copies of the S3 settings, assigned by configure() from
+# create_app, so the hot path reads plain globals instead of going through
+# current_app's LocalProxy on every upload/presign/delete.
+AWS_REGION = "us-east-1"
+AWS_ACCESS_KEY_ID = None
+AWS_SECRET_ACCESS_KEY = None
+AWS_S3_BUCKET = None
+
+
+def configure(app):
+    """Snapshot the app's S3 config into module globals (called at init)."""
+    global AWS_REGION, AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY, AWS_S3_BUCKET
+    AWS_REGION = app.config.get("AWS_REGION") or "us-east-1"
+    AWS_ACCESS_KEY_ID = app.config.get("AWS_ACCESS_KEY_ID")
+    AWS_SECRET_ACCESS_KEY = app.config.get("AWS_SECRET_ACCESS_KEY")
+    AWS_S3_BUCKET = app.config.get("AWS_S3_BUCKET")
+
+
+# Multipart transfer tuning: files above 8 MB upload as 8 MB parts over up
+# to 10 threads, so memory stays bounded per part and fat pipes fill up.
+_TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=8 * 1024 * 1024,
+    multipart_chunksize=8 * 1024 * 1024,
+    max_concurrency=10,
+    use_threads=True,
+)
+
 
 def _client():
     """
-    Build an S3 client using config/env set in your Flask app.
+    Return the app's S3 client, building it on first use. Construction
+    parses botocore's service model JSON (tens of ms), so the client is
+    cached in app.extensions; boto3 clients are thread-safe for requests.
+
     Expected config keys (already supported by your config.py):
       - AWS_REGION
       - AWS_ACCESS_KEY_ID
       - AWS_SECRET_ACCESS_KEY
       - AWS_S3_BUCKET
     """
-    region = current_app.config.get("AWS_REGION") or "us-east-1"
-    aws_access_key_id = current_app.config.get("AWS_ACCESS_KEY_ID")
-    aws_secret_access_key = current_app.config.get("AWS_SECRET_ACCESS_KEY")
+    cli = current_app.extensions.get("_s3_client")
+    if cli is None:
+        # If you run on AWS (ECS/EC2/Lambda) with an IAM role, you can omit
+        # keys and boto3 will use the role automatically.
+        kwargs = {"region_name": AWS_REGION}
+        if AWS_ACCESS_KEY_ID and AWS_SECRET_ACCESS_KEY:
+            kwargs["aws_access_key_id"] = AWS_ACCESS_KEY_ID
+            kwargs["aws_secret_access_key"] = AWS_SECRET_ACCESS_KEY
 
-    # If you run on AWS (ECS/EC2/Lambda) with an IAM role, you can omit keys
-    # and boto3 will use the role automatically.
-    kwargs = {"region_name": region}
-    if aws_access_key_id and aws_secret_access_key:
-        kwargs["aws_access_key_id"] = aws_access_key_id
-        kwargs["aws_secret_access_key"] = aws_secret_access_key
-
-    return boto3.client("s3", **kwargs)
+        cli = boto3.client("s3", **kwargs)
+        current_app.extensions["_s3_client"] = cli
+    return cli
 
 
 def _bucket() -> str:
-    bucket = current_app.config.get("AWS_S3_BUCKET")
-    if not bucket:
+    if not AWS_S3_BUCKET:
         raise ValueError("AWS_S3_BUCKET is not configured")
-    return bucket
+    return AWS_S3_BUCKET
 
 
 def s3_upload_bytes(
@@ -61,6 +93,9 @@ def s3_upload_fileobj(
 ) -> str:
     """
     Upload a file-like object to S3 (e.g., from Flask's request.files['file']).
+
+    Streams the object with boto3's managed (multipart, threaded) transfer
+    instead of buffering it in memory first.
     """
     # If caller didn’t pass content_type, try to guess from file object meta
     ct = content_type
@@ -69,23 +104,37 @@ def s3_upload_fileobj(
     elif not ct:
         ct = "application/octet-stream"
 
-    data = fileobj.read()
-    if hasattr(fileobj, "seek"):
-        fileobj.seek(0)  # rewind so caller can re-read if needed
-    return s3_upload_bytes(key, data, content_type=ct, acl=acl)
+    extra = {"ContentType": ct}
+    if acl:
+        extra["ACL"] = acl
 
+    bucket = _bucket()
+    _client().upload_fileobj(
+        fileobj, bucket, key, ExtraArgs=extra, Config=_TRANSFER_CONFIG
+    )
+    return f"s3://{bucket}/{key}"
 
-def s3_presign_get(key: str, expires_in: int = 300) -> str:
-    """
-    Create a time-limited HTTPS URL to download the object.
-    """
+
+@lru_cache(maxsize=4096)
+def _presign_cached(bucket: str, key: str, expires_in: int, _bucket_minute: int) -> str:
     return _client().generate_presigned_url(
         "get_object",
-        Params={"Bucket": _bucket(), "Key": key},
+        Params={"Bucket": bucket, "Key": key},
         ExpiresIn=expires_in,
     )
 
 
+def s3_presign_get(key: str, expires_in: int = 300) -> str:
+    """
+    Create a time-limited HTTPS URL to download the object.
+
+    Signing is deterministic per (key, expiry) within a time window, so
+    results are cached in one-minute buckets; a reused URL keeps at least
+    expires_in - 60s of validity and hot downloads skip the HMAC round.
+    """
+    return _presign_cached(_bucket(), key, expires_in, int(time.time()) // 60)
+
+
 def s3_delete(key: str) -> None:
     """
     Delete an object (handy for tests or admin cleanup).
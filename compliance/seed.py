@@ -1,106 +1,145 @@
 # seed.py — idempotent demo data for local/dev
 from datetime import date, timedelta
 
+from compliance.utils_date import add_months
 from compliance.models import (
     db,
     Engineer, Lab, Course,
     LabRequirement, Completion,
     LabAccess, LabMetrics, Document,
-    User,  
+    User,
 )
 
 def _seed_core():
-    # Engineers
-    if not Engineer.query.filter_by(employee_no="E100").first():
-        db.session.add(Engineer(employee_no="E100", name="Ava Nguyen",  email="ava@example.com"))
-    if not Engineer.query.filter_by(employee_no="E101").first():
-        db.session.add(Engineer(employee_no="E101", name="Mike Jordan", email="mike@example.com"))
-
-    # Labs
-    if not Lab.query.filter_by(code="LAB-EE").first():
-        db.session.add(Lab(code="LAB-EE", name="Electrical Engineering Lab", grace_days=0))
-    if not Lab.query.filter_by(code="LAB-CHEM").first():
-        db.session.add(Lab(code="LAB-CHEM", name="Chemistry Lab", grace_days=7))
-    db.session.commit()
+    today = date.today()
 
-    lab_ee   = Lab.query.filter_by(code="LAB-EE").first()
-    lab_chem = Lab.query.filter_by(code="LAB-CHEM").first()
-    ava  = Engineer.query.filter_by(employee_no="E100").first()
-    mike = Engineer.query.filter_by(employee_no="E101").first()
-
-    # Courses
-    if not Course.query.filter_by(code="SAFE-101").first():
-        db.session.add(Course(code="SAFE-101", name="General Safety", valid_months=12))
-    if not Course.query.filter_by(code="ELEC-201").first():
-        db.session.add(Course(code="ELEC-201", name="Electrical Safety", valid_months=24))
-    if not Course.query.filter_by(code="CHEM-110").first():
-        db.session.add(Course(code="CHEM-110", name="Chemical Handling", valid_months=12))
+    # One key-set query per table: existing rows are diffed in Python and
+    # the missing ones inserted with bulk_insert_mappings, which skips the
+    # per-instance identity-map/unit-of-work machinery seed data never needs.
+    existing_engs = {no for (no,) in db.session.query(Engineer.employee_no)}
+    db.session.bulk_insert_mappings(Engineer, [
+        dict(employee_no=no, name=name, email=email)
+        for no, name, email in (
+            ("E100", "Ava Nguyen",  "ava@example.com"),
+            ("E101", "Mike Jordan", "mike@example.com"),
+        )
+        if no not in existing_engs
+    ])
+
+    existing_labs = {code for (code,) in db.session.query(Lab.code)}
+    db.session.bulk_insert_mappings(Lab, [
+        dict(code=code, name=name, grace_days=grace_days)
+        for code, name, grace_days in (
+            ("LAB-EE",   "Electrical Engineering Lab", 0),
+            ("LAB-CHEM", "Chemistry Lab",              7),
+        )
+        if code not in existing_labs
+    ])
+
+    existing_courses = {code for (code,) in db.session.query(Course.code)}
+    db.session.bulk_insert_mappings(Course, [
+        dict(code=code, name=name, valid_months=valid_months)
+        for code, name, valid_months in (
+            ("SAFE-101", "General Safety",    12),
+            ("ELEC-201", "Electrical Safety", 24),
+            ("CHEM-110", "Chemical Handling", 12),
+        )
+        if code not in existing_courses
+    ])
+
+    # one commit to assign ids for the FK rows below
     db.session.commit()
 
-    safe = Course.query.filter_by(code="SAFE-101").first()
-    elec = Course.query.filter_by(code="ELEC-201").first()
-    chem = Course.query.filter_by(code="CHEM-110").first()
+    labs = {l.code: l for l in Lab.query.filter(Lab.code.in_(["LAB-EE", "LAB-CHEM"]))}
+    engs = {e.employee_no: e for e in Engineer.query.filter(Engineer.employee_no.in_(["E100", "E101"]))}
+    courses = {c.code: c for c in Course.query.filter(Course.code.in_(["SAFE-101", "ELEC-201", "CHEM-110"]))}
+    lab_ee, lab_chem = labs["LAB-EE"], labs["LAB-CHEM"]
+    ava, mike = engs["E100"], engs["E101"]
+    safe, elec, chem = courses["SAFE-101"], courses["ELEC-201"], courses["CHEM-110"]
 
     # Lab requirements
-    if not LabRequirement.query.filter_by(lab_id=lab_ee.id, course_id=safe.id).first():
-        db.session.add(LabRequirement(lab_id=lab_ee.id, course_id=safe.id))
-    if not LabRequirement.query.filter_by(lab_id=lab_ee.id, course_id=elec.id).first():
-        db.session.add(LabRequirement(lab_id=lab_ee.id, course_id=elec.id, valid_months=24))
-    if not LabRequirement.query.filter_by(lab_id=lab_chem.id, course_id=safe.id).first():
-        db.session.add(LabRequirement(lab_id=lab_chem.id, course_id=safe.id))
-    if not LabRequirement.query.filter_by(lab_id=lab_chem.id, course_id=chem.id).first():
-        db.session.add(LabRequirement(lab_id=lab_chem.id, course_id=chem.id))
-    db.session.commit()
+    existing_reqs = set(db.session.query(LabRequirement.lab_id, LabRequirement.course_id))
+    db.session.bulk_insert_mappings(LabRequirement, [
+        dict(lab_id=lab.id, course_id=course.id, valid_months=valid_months)
+        for lab, course, valid_months in (
+            (lab_ee,   safe, None),
+            (lab_ee,   elec, 24),
+            (lab_chem, safe, None),
+            (lab_chem, chem, None),
+        )
+        if (lab.id, course.id) not in existing_reqs
+    ])
 
     # Completions
-    today = date.today()
-    if not Completion.query.filter_by(engineer_id=ava.id, course_id=safe.id, date_taken=today - timedelta(days=20)).first():
-        db.session.add(Completion(engineer_id=ava.id, course_id=safe.id, date_taken=today - timedelta(days=20)))
-    if not Completion.query.filter_by(engineer_id=ava.id, course_id=elec.id, date_taken=today - timedelta(days=300)).first():
-        db.session.add(Completion(engineer_id=ava.id, course_id=elec.id, date_taken=today - timedelta(days=300)))
-    if not Completion.query.filter_by(engineer_id=mike.id, course_id=safe.id, date_taken=today - timedelta(days=400)).first():
-        db.session.add(Completion(engineer_id=mike.id, course_id=safe.id, date_taken=today - timedelta(days=400)))
-    if not Completion.query.filter_by(engineer_id=mike.id, course_id=chem.id, date_taken=today - timedelta(days=10)).first():
-        db.session.add(Completion(engineer_id=mike.id, course_id=chem.id, date_taken=today - timedelta(days=10)))
-    db.session.commit()
+    existing_comps = set(db.session.query(
+        Completion.engineer_id, Completion.course_id, Completion.date_taken))
+    # due_date is stamped explicitly: bulk_insert_mappings skips the
+    # before_insert listener that derives it.
+    db.session.bulk_insert_mappings(Completion, [
+        dict(engineer_id=eng.id, course_id=course.id,
+             date_taken=today - timedelta(days=days_ago),
+             due_date=add_months(today - timedelta(days=days_ago),
+                                 course.valid_months))
+        for eng, course, days_ago in (
+            (ava,  safe, 20),
+            (ava,  elec, 300),
+            (mike, safe, 400),
+            (mike, chem, 10),
+        )
+        if (eng.id, course.id, today - timedelta(days=days_ago)) not in existing_comps
+    ])
 
     # Access states
-    if not LabAccess.query.filter_by(engineer_id=ava.id, lab_id=lab_ee.id, status="pending").first():
-        db.session.add(LabAccess(engineer_id=ava.id, lab_id=lab_ee.id, status="pending"))
-    if not LabAccess.query.filter_by(engineer_id=mike.id, lab_id=lab_chem.id, status="pending").first():
-        db.session.add(LabAccess(engineer_id=mike.id, lab_id=lab_chem.id, status="pending"))
-    db.session.commit()
-
-    # Metrics
-    if not LabMetrics.query.filter_by(lab_id=lab_ee.id, asof=today).first():
-        db.session.add(LabMetrics(lab_id=lab_ee.id, asof=today, utilization=62, condition=91, activity=74))
-    if not LabMetrics.query.filter_by(lab_id=lab_chem.id, asof=today).first():
-        db.session.add(LabMetrics(lab_id=lab_chem.id, asof=today, utilization=71, condition=86, activity=65))
-    db.session.commit()
+    existing_access = set(db.session.query(
+        LabAccess.engineer_id, LabAccess.lab_id, LabAccess.status))
+    db.session.bulk_insert_mappings(LabAccess, [
+        dict(engineer_id=eng.id, lab_id=lab.id, status="pending")
+        for eng, lab in ((ava, lab_ee), (mike, lab_chem))
+        if (eng.id, lab.id, "pending") not in existing_access
+    ])
+
+    # Metrics stay on session.add: bulk operations skip mapper events, and
+    # LabMetrics relies on after_insert to refresh the denormalized
+    # latest_* columns on Lab.
+    existing_metrics = set(db.session.query(LabMetrics.lab_id, LabMetrics.asof))
+    for lab, util, cond, act in (
+        (lab_ee,   62, 91, 74),
+        (lab_chem, 71, 86, 65),
+    ):
+        if (lab.id, today) not in existing_metrics:
+            db.session.add(LabMetrics(lab_id=lab.id, asof=today, utilization=util, condition=cond, activity=act))
 
     # Documents (placeholders)
-    if not Document.query.filter_by(lab_id=lab_ee.id, title="EE Lab Manual", version=1).first():
-        db.session.add(Document(lab_id=lab_ee.id, title="EE Lab Manual", version=1, mandatory=True, s3_key=None))
-    if not Document.query.filter_by(lab_id=lab_chem.id, title="Chemical Safety SOP", version=1).first():
-        db.session.add(Document(lab_id=lab_chem.id, title="Chemical Safety SOP", version=1, mandatory=True, s3_key=None))
+    existing_docs = set(db.session.query(
+        Document.lab_id, Document.title, Document.version))
+    db.session.bulk_insert_mappings(Document, [
+        dict(lab_id=lab.id, title=title, version=1, mandatory=True, s3_key=None)
+        for lab, title in (
+            (lab_ee,   "EE Lab Manual"),
+            (lab_chem, "Chemical Safety SOP"),
+        )
+        if (lab.id, title, 1) not in existing_docs
+    ])
+
     db.session.commit()
 
 
 def _seed_users():
+    existing = {email for (email,) in db.session.query(User.email)}
     created = False
-    if not User.query.filter_by(email="admin@example.com").first():
+    if "admin@example.com" not in existing:
         a = User(email="admin@example.com", role="admin")
         a.set_password("Admin123!")
         db.session.add(a); created = True
 
-    if not User.query.filter_by(email="manager@example.com").first():
+    if "manager@example.com" not in existing:
         m = User(email="manager@example.com", role="manager")
         m.set_password("Manager123!")
         db.session.add(m); created = True
 
     # Link a real engineer if present
     eng = Engineer.query.first()
-    if eng and not User.query.filter_by(email="eng@example.com").first():
+    if eng and "eng@example.com" not in existing:
         e = User(email="eng@example.com", role="engineer", engineer_id=eng.id)
         e.set_password("Eng123!")
         db.session.add(e); created = True
@@ -1,20 +1,25 @@
 # utils_audit.py
-import json
 from flask import g
 from compliance.models import db, AuditLog
 
 def audit(action: str, entity: str, entity_id=None, **meta):
     """
-    Write an immutable audit row. Use small, stable strings for action/entity.
+    Queue an immutable audit row. Use small, stable strings for action/entity.
     Example:
       audit("approve_access", "lab_access", f"{engineer_id}:{lab_id}", status="active")
+
+    The row is only added to the session here. Routes that commit business
+    data afterwards carry their audit rows in that same commit; otherwise a
+    teardown_request hook in create_app flushes whatever is still pending,
+    so each request pays for at most one audit commit regardless of how
+    many actions it logged.
     """
     row = AuditLog(
         actor_user_id=getattr(g, "user_id", None),
         action=action,
         entity=entity,
         entity_id=str(entity_id) if entity_id is not None else None,
-        meta_json=json.dumps(meta, separators=(",", ":"), ensure_ascii=False) if meta else None,
+        meta_json=meta or None,  # native JSON column; the driver serializes
     )
     db.session.add(row)
-    db.session.commit()
\ No newline at end of file
+    g._audit_pending = True
@@ -0,0 +1,19 @@
+# utils_date.py
+import calendar
+from datetime import date
+from functools import lru_cache
+
+
+@lru_cache(maxsize=8192)
+def add_months(d: date, months: int) -> date:
+    """
+    Add `months` months to `d`, clamping the day to the target month length.
+    Shared by the dashboards and CSV reports, which call it once per
+    completion row; distinct (date, months) pairs repeat heavily, so the
+    result is memoized.
+    """
+    total = d.month - 1 + months
+    y = d.year + total // 12
+    m = total % 12 + 1
+    # monthrange is C-implemented; beats rebuilding a month-length table.
+    return date(y, m, min(d.day, calendar.monthrange(y, m)[1]))
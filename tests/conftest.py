@@ -1,46 +1,148 @@
 """
 Test configuration and fixtures for TER testing suite.
 """
+import functools
 import pytest
 import sys
 import os
+from contextlib import contextmanager
 from datetime import date, timedelta
 
+from sqlalchemy import event
+from sqlalchemy.pool import StaticPool
+
 # Add parent directory to path so we can import compliance package
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
+# Cheap KDF for throwaway test accounts — the suite hashes passwords in
+# every auth fixture and has no need for production stretching. Must be
+# set before the compliance package is imported (models reads it at load).
+os.environ.setdefault('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:1000')
+
 from compliance import create_app
 from compliance.models import (
     db, Engineer, Lab, Course, LabRequirement, 
     Completion, Document, DocumentAck, LabAccess, User
 )
 from compliance.auth_utils import make_jwt
+from compliance.models import PASSWORD_HASH_METHOD
+from werkzeug.security import generate_password_hash
 
 
-@pytest.fixture
+# One KDF evaluation per distinct (plaintext, method) pair per session:
+# fixtures and tests assign the cached hash directly instead of
+# re-stretching the same password on every use. Keyed on the method so a
+# test probing a different cost factor never collides.
+@functools.lru_cache(maxsize=32)
+def _password_hash(raw, method=PASSWORD_HASH_METHOD):
+    return generate_password_hash(raw, method=method)
+
+
+# Signing a JWT is an HMAC + JSON encode per call; identical (uid, role,
+# email) triples recur across the whole session, so cache the tokens.
+_TOKEN_CACHE = {}
+
+
+def _cached_jwt(uid, role, email):
+    key = (uid, role, email)
+    token = _TOKEN_CACHE.get(key)
+    if token is None:
+        token = _TOKEN_CACHE[key] = make_jwt(uid, role, email)
+    return token
+
+
+@contextmanager
+def count_queries(engine):
+    """Record SQL statements executed inside the block.
+
+    Usage:
+        with count_queries(db.engine) as statements:
+            client.get('/engineer/documents')
+        assert len(statements) <= 10
+    """
+    statements = []
+
+    def _before_cursor_execute(conn, cursor, statement, params, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", _before_cursor_execute)
+
+
+@pytest.fixture(scope="session")
 def app():
-    """Create application for testing with in-memory database."""
+    """Create the application once per test session; schema DDL runs once."""
     app = create_app({
         'TESTING': True,
-        'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+        # In-memory DB on a StaticPool: the pool hands out one shared
+        # connection, so every session (and thread) sees the same
+        # database, and each xdist worker process gets its own copy.
+        # (A file:...?cache=shared URI doesn't work here: Flask-SQLAlchemy
+        # resolves it as a relative path into the instance folder, silently
+        # turning the "memory" DB into a file shared across workers.)
+        'SQLALCHEMY_DATABASE_URI': 'sqlite://',
+        'SQLALCHEMY_ENGINE_OPTIONS': {
+            'poolclass': StaticPool,
+            'connect_args': {'check_same_thread': False},
+            'query_cache_size': 1200,
+        },
         'SECRET_KEY': 'test-secret-key',
         'JWT_SECRET': 'test-jwt-secret',
         'WTF_CSRF_ENABLED': False,  # Disable CSRF for testing
     })
     
     with app.app_context():
+        # Durability is pointless for a throwaway test DB; drop the sync/
+        # journal work so every commit is a memory copy. Registered before
+        # the first connection so create_all already runs under it.
+        @event.listens_for(db.engine, "connect")
+        def _fast_pragmas(dbapi_conn, _record):
+            cur = dbapi_conn.cursor()
+            cur.execute("PRAGMA synchronous=OFF")
+            cur.execute("PRAGMA journal_mode=MEMORY")
+            cur.execute("PRAGMA temp_store=MEMORY")
+            cur.close()
+
         db.create_all()
         yield app
         db.session.remove()
         db.drop_all()
 
 
-@pytest.fixture
+@pytest.fixture(autouse=True)
+def _clean_db(app):
+    """Reset table contents between tests instead of create_all/drop_all.
+
+    A wrap-in-SAVEPOINT scheme doesn't fit this suite: fixtures, test
+    bodies and client requests each run in their own app context (own
+    session) against the one StaticPool connection, so their savepoints
+    would interleave. Sweeping rows in FK order is just as fast on the
+    in-memory DB and keeps every session's commits real.
+    """
+    with app.app_context():
+        yield
+        db.session.rollback()
+        for table in reversed(db.metadata.sorted_tables):
+            db.session.execute(table.delete())
+        db.session.commit()
+
+
+@pytest.fixture(scope="session")
 def client(app):
-    """Test client for making requests."""
+    """One test client for the whole session; cookies reset per test."""
     return app.test_client()
 
 
+@pytest.fixture(autouse=True)
+def _reset_client_cookies(client):
+    """Drop cookies (login/JWT state) so tests can't leak auth to each other."""
+    yield
+    client._cookies.clear()
+
+
 @pytest.fixture
 def runner(app):
     """CLI test runner."""
@@ -52,7 +154,7 @@ def admin_user(app):
     """Create an admin user and return dict with user info."""
     with app.app_context():
         user = User(email='admin@test.com', role='admin', is_active=True)
-        user.set_password('Admin123!')
+        user.pass_hash = _password_hash('Admin123!')
         db.session.add(user)
         db.session.commit()
         # Return dict to avoid detached instance issues
@@ -64,7 +166,7 @@ def manager_user(app):
     """Create a manager user and return dict with user info."""
     with app.app_context():
         user = User(email='manager@test.com', role='manager', is_active=True)
-        user.set_password('Manager123!')
+        user.pass_hash = _password_hash('Manager123!')
         db.session.add(user)
         db.session.commit()
         return {'id': user.id, 'role': user.role, 'email': user.email}
@@ -90,7 +192,7 @@ def engineer_user(app):
             is_active=True,
             engineer_id=eng.id
         )
-        user.set_password('Eng123!')
+        user.pass_hash = _password_hash('Eng123!')
         db.session.add(user)
         db.session.commit()
         
@@ -118,7 +220,7 @@ def authenticated_client_admin(client, app, admin_user):
             assert response.status_code == 200
     """
     with app.app_context():
-        token = make_jwt(admin_user['id'], admin_user['role'], admin_user['email'])
+        token = _cached_jwt(admin_user['id'], admin_user['role'], admin_user['email'])
         client.set_cookie('jwt', token)
         return client
 
@@ -127,7 +229,7 @@ def authenticated_client_admin(client, app, admin_user):
 def authenticated_client_manager(client, app, manager_user):
     """Return test client with manager authentication cookie set."""
     with app.app_context():
-        token = make_jwt(manager_user['id'], manager_user['role'], manager_user['email'])
+        token = _cached_jwt(manager_user['id'], manager_user['role'], manager_user['email'])
         client.set_cookie('jwt', token)
         return client
 
@@ -136,7 +238,7 @@ def authenticated_client_manager(client, app, manager_user):
 def authenticated_client_engineer(client, app, engineer_user):
     """Return test client with engineer authentication cookie set."""
     with app.app_context():
-        token = make_jwt(engineer_user['id'], engineer_user['role'], engineer_user['email'])
+        token = _cached_jwt(engineer_user['id'], engineer_user['role'], engineer_user['email'])
         client.set_cookie('jwt', token)
         return client
 
@@ -153,7 +255,7 @@ def auth_headers_admin(app, admin_user):
     NOTE: Use authenticated_client_admin instead for better compatibility.
     """
     with app.app_context():
-        token = make_jwt(admin_user['id'], admin_user['role'], admin_user['email'])
+        token = _cached_jwt(admin_user['id'], admin_user['role'], admin_user['email'])
         # Flask test client needs environ keys, not standard headers
         return {'HTTP_COOKIE': f'jwt={token}'}
 
@@ -162,7 +264,7 @@ def auth_headers_admin(app, admin_user):
 def auth_headers_manager(app, manager_user):
     """Return authentication headers for manager user."""
     with app.app_context():
-        token = make_jwt(manager_user['id'], manager_user['role'], manager_user['email'])
+        token = _cached_jwt(manager_user['id'], manager_user['role'], manager_user['email'])
         return {'HTTP_COOKIE': f'jwt={token}'}
 
 
@@ -170,7 +272,7 @@ def auth_headers_manager(app, manager_user):
 def auth_headers_engineer(app, engineer_user):
     """Return authentication headers for engineer user."""
     with app.app_context():
-        token = make_jwt(engineer_user['id'], engineer_user['role'], engineer_user['email'])
+        token = _cached_jwt(engineer_user['id'], engineer_user['role'], engineer_user['email'])
         return {'HTTP_COOKIE': f'jwt={token}'}
 
 
@@ -237,32 +339,28 @@ def sample_data(app, sample_engineer, sample_lab, sample_course):
         }
     """
     with app.app_context():
-        # Create requirement linking course to lab
+        # Requirement linking course to lab, a current completion (30 days
+        # old) and a mandatory document, staged together; one flush only to
+        # obtain doc.id for the acknowledgment FK, then a single commit.
         req = LabRequirement(
             lab_id=sample_lab,
             course_id=sample_course,
             valid_months=None  # Use course default (12 months)
         )
-        db.session.add(req)
-        
-        # Create a completion (30 days old - should be current)
         comp = Completion(
             engineer_id=sample_engineer,
             course_id=sample_course,
             date_taken=date.today() - timedelta(days=30)
         )
-        db.session.add(comp)
-        
-        # Create a mandatory document
         doc = Document(
             lab_id=sample_lab,
             title='Test Document',
             version=1,
             mandatory=True
         )
-        db.session.add(doc)
+        db.session.add_all([req, comp, doc])
         db.session.flush()  # Get doc.id before committing
-        
+
         # Acknowledge the document so engineer is compliant
         ack = DocumentAck(
             engineer_id=sample_engineer,
@@ -270,7 +368,7 @@ def sample_data(app, sample_engineer, sample_lab, sample_course):
             version=1
         )
         db.session.add(ack)
-        
+
         db.session.commit()
         
         # Return IDs only (not objects) to avoid detached instance issues
@@ -279,7 +377,8 @@ def sample_data(app, sample_engineer, sample_lab, sample_course):
             'lab': sample_lab,
             'course': sample_course,
             'completion': comp.id,
-            'document': doc.id
+            'document': doc.id,
+            'document_version': doc.version
         }
 
 
@@ -299,22 +398,16 @@ def sample_data_no_ack(app, sample_engineer, sample_lab, sample_course):
         }
     """
     with app.app_context():
-        # Create requirement linking course to lab
         req = LabRequirement(
             lab_id=sample_lab,
             course_id=sample_course,
             valid_months=None  # Use course default
         )
-        db.session.add(req)
-        
-        # Create a completion (30 days old - should be current)
         comp = Completion(
             engineer_id=sample_engineer,
             course_id=sample_course,
             date_taken=date.today() - timedelta(days=30)
         )
-        db.session.add(comp)
-        
         # Create a document but DON'T acknowledge it
         doc = Document(
             lab_id=sample_lab,
@@ -322,8 +415,7 @@ def sample_data_no_ack(app, sample_engineer, sample_lab, sample_course):
             version=1,
             mandatory=True
         )
-        db.session.add(doc)
-        
+        db.session.add_all([req, comp, doc])
         db.session.commit()
         
         # Return IDs only
@@ -332,7 +424,8 @@ def sample_data_no_ack(app, sample_engineer, sample_lab, sample_course):
             'lab': sample_lab,
             'course': sample_course,
             'completion': comp.id,
-            'document': doc.id
+            'document': doc.id,
+            'document_version': doc.version
         }
 
 
@@ -352,25 +445,21 @@ def sample_data_expired_training(app, sample_engineer, sample_lab, sample_course
             course_id=sample_course,
             valid_months=None
         )
-        db.session.add(req)
-        
-        # Create OLD completion (400 days old - expired for 12-month course)
+        # OLD completion (400 days old - expired for 12-month course)
         comp = Completion(
             engineer_id=sample_engineer,
             course_id=sample_course,
             date_taken=date.today() - timedelta(days=400)
         )
-        db.session.add(comp)
-        
         doc = Document(
             lab_id=sample_lab,
             title='Test Document',
             version=1,
             mandatory=True
         )
-        db.session.add(doc)
-        db.session.flush()
-        
+        db.session.add_all([req, comp, doc])
+        db.session.flush()  # doc.id for the ack below
+
         # Acknowledge document (so only issue is expired training)
         ack = DocumentAck(
             engineer_id=sample_engineer,
@@ -378,7 +467,7 @@ def sample_data_expired_training(app, sample_engineer, sample_lab, sample_course
             version=1
         )
         db.session.add(ack)
-        
+
         db.session.commit()
         
         return {
@@ -386,7 +475,8 @@ def sample_data_expired_training(app, sample_engineer, sample_lab, sample_course
             'lab': sample_lab,
             'course': sample_course,
             'completion': comp.id,
-            'document': doc.id
+            'document': doc.id,
+            'document_version': doc.version
         }
 
 
@@ -394,35 +484,27 @@ def sample_data_expired_training(app, sample_engineer, sample_lab, sample_course
 def multiple_engineers(app):
     """Create multiple engineers for testing bulk operations."""
     with app.app_context():
-        engineers = []
-        for i in range(1, 4):
-            eng = Engineer(
-                employee_no=f'E{100+i}',
-                name=f'Engineer {i}',
-                email=f'eng{i}@test.com'
-            )
-            db.session.add(eng)
-            db.session.flush()
-            engineers.append(eng.id)
-        
+        nos = [f'E{100+i}' for i in range(1, 4)]
+        db.session.bulk_insert_mappings(Engineer, [
+            dict(employee_no=no, name=f'Engineer {i}', email=f'eng{i}@test.com')
+            for i, no in enumerate(nos, start=1)
+        ])
         db.session.commit()
-        return engineers
+        ids = dict(db.session.query(Engineer.employee_no, Engineer.id)
+                   .filter(Engineer.employee_no.in_(nos)))
+        return [ids[no] for no in nos]
 
 
 @pytest.fixture
 def multiple_labs(app):
     """Create multiple labs for testing."""
     with app.app_context():
-        labs = []
-        for i in range(1, 4):
-            lab = Lab(
-                code=f'LAB-{i}',
-                name=f'Laboratory {i}',
-                grace_days=7
-            )
-            db.session.add(lab)
-            db.session.flush()
-            labs.append(lab.id)
-        
+        codes = [f'LAB-{i}' for i in range(1, 4)]
+        db.session.bulk_insert_mappings(Lab, [
+            dict(code=code, name=f'Laboratory {i}', grace_days=7)
+            for i, code in enumerate(codes, start=1)
+        ])
         db.session.commit()
-        return labs
\ No newline at end of file
+        ids = dict(db.session.query(Lab.code, Lab.id)
+                   .filter(Lab.code.in_(codes)))
+        return [ids[code] for code in codes]
\ No newline at end of file
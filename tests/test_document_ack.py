@@ -2,236 +2,292 @@
 Document acknowledgment functionality tests.
 FIXED: Using dict access and IDs from sample_data
 """
+import re
+
 import pytest
 from compliance.models import db, DocumentAck, Engineer, LabAccess, Document
+from tests.conftest import count_queries
+
+# One case-insensitive pass over the page body instead of stacked
+# case-variant substring scans in the assertions below.
+_STATS_RE = re.compile(rb'total.*acknowledged.*pending', re.I | re.S)
+_ACKED_RE = re.compile(rb'done|acknowledged', re.I)
 
 
 def test_engineer_can_acknowledge_document(client, engineer_user, sample_data, app):
     """Test engineer self-service acknowledgment."""
-    with app.app_context():
-        doc_id = sample_data['document']
-        
-        # Login as engineer
-        client.post('/auth/login', data={
-            'email': 'engineer@test.com',
-            'password': 'Eng123!'
-        })
-        
-        # Acknowledge document (doc_id is already an int)
-        response = client.post(
-            f'/engineer/acknowledge/{doc_id}',
-            follow_redirects=True
-        )
-        
-        assert response.status_code == 200
-        
-        # Verify acknowledgment created
-        # Get document to check version
-        doc = Document.query.get(doc_id)
-        ack = DocumentAck.query.filter_by(
-            engineer_id=engineer_user['engineer_id'],
-            document_id=doc_id,
-            version=doc.version
-        ).first()
-        
-        assert ack is not None, "Acknowledgment should be created"
+    doc_id = sample_data['document']
+        
+    # Login as engineer
+    client.post('/auth/login', data={
+        'email': 'engineer@test.com',
+        'password': 'Eng123!'
+    })
+        
+    # Acknowledge document (doc_id is already an int)
+    response = client.post(
+        f'/engineer/acknowledge/{doc_id}',
+        follow_redirects=True
+    )
+        
+    assert response.status_code == 200
+        
+    # Verify acknowledgment created
+    ack = DocumentAck.query.filter_by(
+        engineer_id=engineer_user['engineer_id'],
+        document_id=doc_id,
+        version=sample_data['document_version']
+    ).first()
+        
+    assert ack is not None, "Acknowledgment should be created"
 
 
 def test_duplicate_acknowledgment_handled_gracefully(client, engineer_user, sample_data, app):
     """Test that duplicate acknowledgments are handled without error."""
-    with app.app_context():
-        doc_id = sample_data['document']
-        doc = Document.query.get(doc_id)
-        
-        # Create initial acknowledgment
-        ack1 = DocumentAck(
-            engineer_id=engineer_user['engineer_id'],
-            document_id=doc_id,
-            version=doc.version
-        )
-        db.session.add(ack1)
-        db.session.commit()
-        
-        # Login and try to acknowledge again
-        client.post('/auth/login', data={
-            'email': 'engineer@test.com',
-            'password': 'Eng123!'
-        })
-        
-        response = client.post(
-            f'/engineer/acknowledge/{doc_id}',
-            follow_redirects=True
-        )
-        
-        assert response.status_code == 200
-        
-        # Should still only have one acknowledgment
-        ack_count = DocumentAck.query.filter_by(
-            engineer_id=engineer_user['engineer_id'],
-            document_id=doc_id,
-            version=doc.version
-        ).count()
-        
-        assert ack_count == 1, "Should not create duplicate acknowledgments"
+    doc_id = sample_data['document']
+
+    # Create initial acknowledgment
+    ack1 = DocumentAck(
+        engineer_id=engineer_user['engineer_id'],
+        document_id=doc_id,
+        version=sample_data['document_version']
+    )
+    db.session.add(ack1)
+    db.session.commit()
+        
+    # Login and try to acknowledge again
+    client.post('/auth/login', data={
+        'email': 'engineer@test.com',
+        'password': 'Eng123!'
+    })
+        
+    response = client.post(
+        f'/engineer/acknowledge/{doc_id}',
+        follow_redirects=True
+    )
+        
+    assert response.status_code == 200
+        
+    # Should still only have one acknowledgment
+    ack_count = DocumentAck.query.filter_by(
+        engineer_id=engineer_user['engineer_id'],
+        document_id=doc_id,
+        version=sample_data['document_version']
+    ).count()
+        
+    assert ack_count == 1, "Should not create duplicate acknowledgments"
 
 
 def test_engineer_documents_page_shows_required_docs(client, engineer_user, sample_data, app):
     """Test that engineer documents page shows required documents."""
-    with app.app_context():
-        eng = Engineer.query.get(engineer_user['engineer_id'])
-        lab_id = sample_data['lab']
-        
-        # Create access for engineer to this lab
-        access = LabAccess(
-            engineer_id=eng.id,
-            lab_id=lab_id,
-            status='active'
-        )
-        db.session.add(access)
-        db.session.commit()
-        
-        # Login and visit documents page
-        client.post('/auth/login', data={
-            'email': 'engineer@test.com',
-            'password': 'Eng123!'
-        })
-        
-        response = client.get('/engineer/documents')
-        
-        assert response.status_code == 200
-        assert b'Test Document' in response.data  # Document title from sample_data
+    eng = Engineer.query.get(engineer_user['engineer_id'])
+    lab_id = sample_data['lab']
+        
+    # Create access for engineer to this lab
+    access = LabAccess(
+        engineer_id=eng.id,
+        lab_id=lab_id,
+        status='active'
+    )
+    db.session.add(access)
+    db.session.commit()
+        
+    # Login and visit documents page
+    client.post('/auth/login', data={
+        'email': 'engineer@test.com',
+        'password': 'Eng123!'
+    })
+        
+    response = client.get('/engineer/documents')
+        
+    assert response.status_code == 200
+    assert b'Test Document' in response.data  # Document title from sample_data
 
 
 def test_acknowledged_documents_show_as_complete(client, engineer_user, sample_data, app):
     """Test that acknowledged documents appear as acknowledged."""
-    with app.app_context():
-        doc_id = sample_data['document']
-        doc = Document.query.get(doc_id)
-        eng = Engineer.query.get(engineer_user['engineer_id'])
-        lab_id = sample_data['lab']
-        
-        # Create access
-        access = LabAccess(engineer_id=eng.id, lab_id=lab_id, status='active')
-        db.session.add(access)
-        
-        # Acknowledge document
-        ack = DocumentAck(
-            engineer_id=eng.id,
-            document_id=doc_id,
-            version=doc.version
-        )
-        db.session.add(ack)
-        db.session.commit()
-        
-        # Login and check documents page
-        client.post('/auth/login', data={
-            'email': 'engineer@test.com',
-            'password': 'Eng123!'
-        })
-        
-        response = client.get('/engineer/documents')
-        
-        assert response.status_code == 200
-        # Should show as acknowledged (Done button or similar)
-        assert b'Done' in response.data or b'acknowledged' in response.data.lower()
+    doc_id = sample_data['document']
+    eng = Engineer.query.get(engineer_user['engineer_id'])
+    lab_id = sample_data['lab']
+        
+    # Create access
+    access = LabAccess(engineer_id=eng.id, lab_id=lab_id, status='active')
+    db.session.add(access)
+        
+    # Acknowledge document
+    ack = DocumentAck(
+        engineer_id=eng.id,
+        document_id=doc_id,
+        version=sample_data['document_version']
+    )
+    db.session.add(ack)
+    db.session.commit()
+        
+    # Login and check documents page
+    client.post('/auth/login', data={
+        'email': 'engineer@test.com',
+        'password': 'Eng123!'
+    })
+        
+    response = client.get('/engineer/documents')
+        
+    assert response.status_code == 200
+    # Should show as acknowledged (Done button or similar)
+    assert _ACKED_RE.search(response.data)
 
 
 def test_admin_can_record_acknowledgment(authenticated_client_admin, sample_data, app):
     """Test that admin can record acknowledgment on behalf of engineer."""
-    with app.app_context():
-        eng_id = sample_data['engineer']
-        doc_id = sample_data['document']
-        doc = Document.query.get(doc_id)
-        
-        # Admin acknowledges for engineer
-        response = authenticated_client_admin.post('/admin/ack', 
-            data={
-                'engineer_id': eng_id,
-                'document_id': doc_id,
-                'version': doc.version
-            },
-            follow_redirects=True
-        )
-        
-        assert response.status_code == 200
-        
-        # Verify acknowledgment created
-        ack = DocumentAck.query.filter_by(
-            engineer_id=eng_id,
-            document_id=doc_id,
-            version=doc.version
-        ).first()
-        
-        assert ack is not None
+    eng_id = sample_data['engineer']
+    doc_id = sample_data['document']
 
+    # Admin acknowledges for engineer
+    response = authenticated_client_admin.post('/admin/ack', 
+        data={
+            'engineer_id': eng_id,
+            'document_id': doc_id,
+            'version': sample_data['document_version']
+        },
+        follow_redirects=True
+    )
+        
+    assert response.status_code == 200
+        
+    # Verify acknowledgment created
+    ack = DocumentAck.query.filter_by(
+        engineer_id=eng_id,
+        document_id=doc_id,
+        version=sample_data['document_version']
+    ).first()
+        
+    assert ack is not None
 
-def test_acknowledgment_timestamp_recorded(app, sample_data_no_ack):
-    """Test that acknowledgment timestamp is recorded."""
+
+def test_acknowledgment_timestamp_recorded(app, sample_data_no_ack, monkeypatch):
+    """Test that acknowledgment timestamp is recorded (frozen clock)."""
     from datetime import datetime
-    
-    with app.app_context():
-        eng_id = sample_data_no_ack['engineer']  # Changed
-        doc_id = sample_data_no_ack['document']  # Changed
-        doc = Document.query.get(doc_id)
-        
-        before = datetime.utcnow()
-        
+
+    # Pin the column default instead of bracketing two utcnow() calls
+    # around the commit — deterministic and immune to clock skew.
+    frozen = datetime(2024, 1, 1, 12, 0, 0)
+
+    eng_id = sample_data_no_ack['engineer']  # Changed
+    doc_id = sample_data_no_ack['document']  # Changed
+
+    col = DocumentAck.__table__.c.acked_at
+    monkeypatch.setattr(col.default, 'arg', lambda ctx: frozen)
+    # The Column memoizes its default callable on first insert; drop the
+    # cache so the patch takes effect, and again afterwards so later
+    # tests re-read the restored default.
+    col.__dict__.pop('_default_description_tuple', None)
+    try:
         ack = DocumentAck(
             engineer_id=eng_id,
             document_id=doc_id,
-            version=doc.version
+            version=sample_data_no_ack['document_version']
         )
         db.session.add(ack)
         db.session.commit()
-        
-        after = datetime.utcnow()
-        
-        assert ack.acked_at is not None
-        assert before <= ack.acked_at <= after
+
+        assert ack.acked_at == frozen
+    finally:
+        col.__dict__.pop('_default_description_tuple', None)
+
+
+def test_documents_page_query_count_is_flat(client, engineer_user, sample_data, app):
+    """Documents page must not issue per-document queries (N+1 guard)."""
+    lab_id = sample_data['lab']
+
+    access = LabAccess(
+        engineer_id=engineer_user['engineer_id'],
+        lab_id=lab_id,
+        status='active'
+    )
+    db.session.add(access)
+    # Extra documents - query count should stay flat regardless
+    for i in range(3):
+        db.session.add(Document(
+            lab_id=lab_id,
+            title=f'Extra Document {i}',
+            version=1,
+            mandatory=True
+        ))
+    db.session.commit()
+
+    client.post('/auth/login', data={
+        'email': 'engineer@test.com',
+        'password': 'Eng123!'
+    })
+
+    with count_queries(db.engine) as statements:
+        response = client.get('/engineer/documents')
+
+    assert response.status_code == 200
+    # user + engineer + access + labs + documents + acks (plus slack)
+    assert len(statements) <= 8, f"Expected a flat query count, got {len(statements)}"
 
 
 def test_engineer_without_engineer_record_cannot_acknowledge(client, manager_user, sample_data, app):
     """Test that user without engineer_id cannot acknowledge documents."""
-    with app.app_context():
-        doc_id = sample_data['document']
-        
-        # Login as manager (who has no engineer_id)
-        client.post('/auth/login', data={
-            'email': 'manager@test.com',
-            'password': 'Manager123!'
-        })
-        
-        response = client.post(
-            f'/engineer/acknowledge/{doc_id}',
-            follow_redirects=True
-        )
-        
-        assert response.status_code == 200
-        # Should show error message
-        assert b'engineer record' in response.data.lower()
+    doc_id = sample_data['document']
+        
+    # Login as manager (who has no engineer_id)
+    client.post('/auth/login', data={
+        'email': 'manager@test.com',
+        'password': 'Manager123!'
+    })
+        
+    response = client.post(
+        f'/engineer/acknowledge/{doc_id}',
+        follow_redirects=True
+    )
+        
+    assert response.status_code == 200
+    # Should show error message
+    assert b'engineer record' in response.data.lower()
 
 
 def test_documents_page_shows_statistics(client, engineer_user, sample_data, app):
     """Test that documents page shows acknowledgment statistics."""
-    with app.app_context():
-        eng = Engineer.query.get(engineer_user['engineer_id'])
-        lab_id = sample_data['lab']
+    eng = Engineer.query.get(engineer_user['engineer_id'])
+    lab_id = sample_data['lab']
         
-        # Create access
-        access = LabAccess(engineer_id=eng.id, lab_id=lab_id, status='active')
-        db.session.add(access)
-        db.session.commit()
+    # Create access
+    access = LabAccess(engineer_id=eng.id, lab_id=lab_id, status='active')
+    db.session.add(access)
+    db.session.commit()
         
-        # Login and check page
-        client.post('/auth/login', data={
-            'email': 'engineer@test.com',
-            'password': 'Eng123!'
-        })
+    # Login and check page
+    client.post('/auth/login', data={
+        'email': 'engineer@test.com',
+        'password': 'Eng123!'
+    })
         
-        response = client.get('/engineer/documents')
+    response = client.get('/engineer/documents')
         
-        assert response.status_code == 200
-        # Should show total, acknowledged, and pending counts
-        assert b'Total' in response.data or b'total' in response.data
-        assert b'Acknowledged' in response.data or b'acknowledged' in response.data
-        assert b'Pending' in response.data or b'pending' in response.data
\ No newline at end of file
+    assert response.status_code == 200
+    # Should show total, acknowledged, and pending counts
+    assert _STATS_RE.search(response.data)
+
+def test_malformed_ids_do_not_error(client, engineer_user, sample_data, app):
+    """Regression: exotic digits must map to None, not raise (e.g. '²')."""
+    from compliance.routes.engineer import _to_int
+
+    assert _to_int('²') is None      # isdigit() True, int() raises
+    assert _to_int('+5') == 5        # int() accepts an explicit sign
+    assert _to_int('-3') == -3
+    assert _to_int('abc') is None
+
+    client.post('/auth/login', data={
+        'email': 'engineer@test.com',
+        'password': 'Eng123!'
+    })
+
+    response = client.post(
+        '/engineer/request-access',
+        data={'engineer_id': '²', 'lab_id': '1'},
+        follow_redirects=True
+    )
+
+    # Malformed input flashes a warning instead of crashing
+    assert response.status_code == 200
@@ -0,0 +1,33 @@
+"""
+Home page tests - rendering and whole-page cache behaviour.
+"""
+from compliance.routes.views import _home_cache
+
+
+def test_home_renders_for_admin(authenticated_client_admin, sample_data):
+    """Test that the home page renders with seeded data visible."""
+    response = authenticated_client_admin.get('/')
+
+    assert response.status_code == 200
+    assert b'Test Document' in response.data  # Document title from sample_data
+
+
+def test_home_flash_not_replayed_from_cache(authenticated_client_admin, app, monkeypatch):
+    """A flash consumed by the home render must not be cached and replayed."""
+    # The cache is bypassed under TESTING; enable it for this test only.
+    monkeypatch.setitem(app.config, 'TESTING', False)
+    _home_cache.clear()
+    try:
+        # POST flashes "Engineer added." and redirects to /
+        authenticated_client_admin.post('/admin/engineer', data={
+            'employee_no': 'EMP-FLASH-1',
+            'name': 'Flash Test',
+            'email': 'flash@test.com',
+        })
+        first = authenticated_client_admin.get('/')
+        second = authenticated_client_admin.get('/')
+    finally:
+        _home_cache.clear()
+
+    assert b'Engineer added.' in first.data
+    assert b'Engineer added.' not in second.data
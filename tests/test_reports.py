@@ -4,14 +4,65 @@ FIXED: Using authenticated_client_* fixtures
 """
 import pytest
 import csv
-from io import StringIO
+from sqlalchemy import insert
 from compliance.models import db, LabAccess
 
+# Immutable module constant — the shared timestamp lives in the
+# X-Generated-At header, not the rows.
+EXPECTED_ACTIVE_COLUMNS = ('engineer_id', 'engineer_name', 'lab_id', 'lab', 'since_utc')
+
+# Read-aside cache for report GETs: the download/format/header tests
+# never mutate state between requests, so each (role, url) pair only
+# needs one trip through the view, ORM and CSV serializer per run.
+# Tests that seed rows first keep calling the client directly.
+_REPORT_CACHE = {}
+
+
+def _cached_report(client, url, role='admin'):
+    key = (role, url)
+    response = _REPORT_CACHE.get(key)
+    if response is None:
+        response = client.get(url)
+        # Reports stream their body; buffer it now, while the request
+        # context is still live, so later tests can re-read it.
+        response.get_data()
+        _REPORT_CACHE[key] = response
+    return response
+
+
+# Decode + CSV-tokenize each cached body once; read-only tests assert
+# against the shared (headers, rows) lists instead of re-parsing.
+_PARSED_CACHE = {}
+
+
+def _iter_lines(response):
+    # Decode the response chunk by chunk so validation can start (and
+    # fail fast) without concatenating the whole body first.
+    buf = ''
+    for chunk in response.iter_encoded():
+        buf += chunk.decode('utf-8')
+        while '\n' in buf:
+            line, buf = buf.split('\n', 1)
+            yield line
+    if buf:
+        yield buf
+
+
+def _parsed_report(client, url, role='admin'):
+    key = (role, url)
+    parsed = _PARSED_CACHE.get(key)
+    if parsed is None:
+        response = _cached_report(client, url, role=role)
+        # splitlines feeds the reader directly; no StringIO wrapper needed
+        rows = list(csv.reader(response.get_data(as_text=True).splitlines()))
+        parsed = _PARSED_CACHE[key] = (rows[0], rows[1:])
+    return parsed
+
 
 def test_active_access_report_downloads(authenticated_client_admin):
     """Test that active access CSV report downloads successfully."""
-    response = authenticated_client_admin.get('/admin/reports/active.csv')
-    
+    response = authenticated_client_admin.head('/admin/reports/active.csv')
+
     assert response.status_code == 200
     assert response.mimetype == 'text/csv'
     assert 'attachment' in response.headers.get('Content-Disposition', '')
@@ -19,169 +70,157 @@ def test_active_access_report_downloads(authenticated_client_admin):
 
 def test_active_access_report_has_correct_columns(authenticated_client_admin):
     """Test that active access report has expected columns."""
-    response = authenticated_client_admin.get('/admin/reports/active.csv')
-    
-    csv_data = response.data.decode('utf-8')
-    reader = csv.reader(StringIO(csv_data))
-    headers = next(reader)
-    
-    expected_columns = ['generated_at_utc', 'engineer_id', 'engineer_name', 'lab_id', 'lab', 'since_utc']
-    assert headers == expected_columns
+    response = _cached_report(authenticated_client_admin, '/admin/reports/active.csv')
+    headers, _rows = _parsed_report(authenticated_client_admin, '/admin/reports/active.csv')
+
+    assert tuple(headers) == EXPECTED_ACTIVE_COLUMNS
+    # The shared timestamp moved out of the rows into a response header
+    assert response.headers.get('X-Generated-At')
 
 
 def test_pending_access_report_downloads(authenticated_client_admin):
     """Test that pending access CSV report downloads successfully."""
-    response = authenticated_client_admin.get('/admin/reports/pending.csv')
-    
+    response = authenticated_client_admin.head('/admin/reports/pending.csv')
+
     assert response.status_code == 200
     assert response.mimetype == 'text/csv'
 
 
 def test_expiring_training_report_downloads(authenticated_client_admin):
     """Test that expiring training report downloads successfully."""
-    response = authenticated_client_admin.get('/admin/reports/expiring30.csv')
-    
+    response = authenticated_client_admin.head('/admin/reports/expiring30.csv')
+
     assert response.status_code == 200
     assert response.mimetype == 'text/csv'
 
 
 def test_compliance_status_report_downloads(authenticated_client_admin):
     """Test that compliance status report downloads successfully."""
-    response = authenticated_client_admin.get('/admin/reports/compliance_status.csv')
-    
+    response = authenticated_client_admin.head('/admin/reports/compliance_status.csv')
+
     assert response.status_code == 200
     assert response.mimetype == 'text/csv'
 
 
 def test_completions_report_downloads(authenticated_client_admin):
     """Test that completions report downloads successfully."""
-    response = authenticated_client_admin.get('/admin/reports/completions.csv')
-    
+    response = authenticated_client_admin.head('/admin/reports/completions.csv')
+
     assert response.status_code == 200
     assert response.mimetype == 'text/csv'
 
 
 def test_document_acks_report_downloads(authenticated_client_admin):
     """Test that document acknowledgments report downloads successfully."""
-    response = authenticated_client_admin.get('/admin/reports/doc_acks.csv')
-    
+    response = authenticated_client_admin.head('/admin/reports/doc_acks.csv')
+
     assert response.status_code == 200
     assert response.mimetype == 'text/csv'
 
 
 def test_access_history_report_downloads(authenticated_client_admin):
     """Test that access history report downloads successfully."""
-    response = authenticated_client_admin.get('/admin/reports/access.csv')
-    
+    response = authenticated_client_admin.head('/admin/reports/access.csv')
+
     assert response.status_code == 200
     assert response.mimetype == 'text/csv'
 
 
+# Both row-seeding tests stay on one xdist worker (-n auto --dist=loadgroup)
+# so their writes never race the read-only majority's cached reads.
+@pytest.mark.xdist_group('reports_mutating')
 def test_active_access_report_includes_data(authenticated_client_admin, sample_data, app):
     """Test that active access report includes actual data."""
     with app.app_context():
         eng_id = sample_data['engineer']
         lab_id = sample_data['lab']
-        
-        # Create active access
-        access = LabAccess(
-            engineer_id=eng_id,
-            lab_id=lab_id,
-            status='active'
-        )
-        db.session.add(access)
-        db.session.commit()
-        
-    response = authenticated_client_admin.get('/admin/reports/active.csv')
-    
-    csv_data = response.data.decode('utf-8')
-    reader = csv.reader(StringIO(csv_data))
-    rows = list(reader)
+
+        # Create active access with a Core insert — the test only reads
+        # the CSV back, so no ORM instance or identity map is needed. A
+        # savepoint instead of a commit: the report request runs on the
+        # same StaticPool connection, so it sees the uncommitted row and
+        # the cleanup fixture's rollback discards it for free.
+        with db.session.begin_nested():
+            db.session.execute(insert(LabAccess).values(
+                engineer_id=eng_id, lab_id=lab_id, status='active'))
+
+        response = authenticated_client_admin.get('/admin/reports/active.csv')
     
-    # Should have header + at least 1 data row
-    assert len(rows) >= 2
-    # Should include engineer name
-    assert any('Sample Engineer' in str(row) for row in rows)
+    # The assertion is really a substring test on the body, so run it on
+    # the raw bytes in one pass rather than tokenizing CSV cell by cell.
+    assert b'Sample Engineer' in response.data
 
 
+@pytest.mark.xdist_group('reports_mutating')
 def test_compliance_status_report_shows_issues(authenticated_client_admin, sample_data, app):
     """Test that compliance status report includes issue details."""
     with app.app_context():
         eng_id = sample_data['engineer']
         lab_id = sample_data['lab']
-        
-        # Create pending access (engineer is non-compliant - missing doc ack)
-        access = LabAccess(
-            engineer_id=eng_id,
-            lab_id=lab_id,
-            status='pending'
-        )
-        db.session.add(access)
-        db.session.commit()
-    
-    response = authenticated_client_admin.get('/admin/reports/compliance_status.csv')
+
+        # Create pending access (engineer is non-compliant - missing doc
+        # ack); savepoint + same-connection read, as above.
+        with db.session.begin_nested():
+            db.session.execute(insert(LabAccess).values(
+                engineer_id=eng_id, lab_id=lab_id, status='pending'))
+
+        response = authenticated_client_admin.get('/admin/reports/compliance_status.csv')
     
     assert response.status_code == 200
-    csv_data = response.data.decode('utf-8')
-    reader = csv.reader(StringIO(csv_data))
+    reader = csv.reader(response.get_data(as_text=True).splitlines())
     headers = next(reader)
     
-    # Should have training_issues and document_issues columns
-    assert 'training_issues' in headers
-    assert 'document_issues' in headers
-
+    # Should have training_issues and document_issues columns; a set
+    # comparison reports every missing column at once.
+    assert {'training_issues', 'document_issues'} <= frozenset(headers)
 
-def test_manager_can_download_reports(authenticated_client_manager):
-    """Test that manager role can download reports."""
-    response = authenticated_client_manager.get('/admin/reports/active.csv')
-    
-    assert response.status_code == 200
-    assert response.mimetype == 'text/csv'
 
+# One matrix instead of three near-identical tests: manager gets the
+# CSV, engineer is rejected, anonymous is redirected or rejected.
+@pytest.mark.parametrize('client_fixture,expected_status,gets_csv', [
+    ('authenticated_client_manager', {200}, True),
+    ('authenticated_client_engineer', {401, 403}, False),
+    ('client', {302, 401, 403}, False),
+])
+def test_report_role_access(request, client_fixture, expected_status, gets_csv):
+    """Test report access per role: manager allowed, engineer/anon not."""
+    c = request.getfixturevalue(client_fixture)
+    response = c.get('/admin/reports/active.csv')
 
-def test_engineer_cannot_download_reports(authenticated_client_engineer):
-    """Test that engineer role cannot download reports."""
-    response = authenticated_client_engineer.get('/admin/reports/active.csv')
-    
-    # Should be forbidden or unauthorized
-    assert response.status_code in [401, 403]
+    assert response.status_code in expected_status
+    if gets_csv:
+        assert response.mimetype == 'text/csv'
+    elif response.status_code != 302:
+        assert response.mimetype != 'text/csv'
 
 
-def test_reports_without_auth_redirect(client):
-    """Test that reports without authentication redirect or fail."""
-    response = client.get('/admin/reports/active.csv')
-    
-    # Should not return CSV - either redirect or unauthorized
-    assert response.status_code in [302, 401, 403]
-    if response.status_code != 302:
-        assert response.mimetype != 'text/csv'
+# One test item per report URL: a failure names the broken report and
+# the items distribute across pytest-xdist workers.
+@pytest.mark.parametrize('report_url', [
+    '/admin/reports/active.csv',
+    '/admin/reports/pending.csv',
+    '/admin/reports/expiring30.csv',
+    '/admin/reports/compliance_status.csv',
+    '/admin/reports/completions.csv',
+    '/admin/reports/doc_acks.csv',
+    '/admin/reports/access.csv',
+])
+def test_csv_reports_are_valid_format(authenticated_client_admin, report_url):
+    """Test that every CSV report produces valid CSV format."""
+    response = _cached_report(authenticated_client_admin, report_url)
 
+    assert response.status_code == 200, f"{report_url} failed to download"
 
-def test_csv_reports_are_valid_format(authenticated_client_admin):
-    """Test that all CSV reports produce valid CSV format."""
-    reports = [
-        '/admin/reports/active.csv',
-        '/admin/reports/pending.csv',
-        '/admin/reports/expiring30.csv',
-        '/admin/reports/compliance_status.csv',
-        '/admin/reports/completions.csv',
-        '/admin/reports/doc_acks.csv',
-        '/admin/reports/access.csv'
-    ]
-    
-    for report_url in reports:
-        response = authenticated_client_admin.get(report_url)
-        
-        assert response.status_code == 200, f"{report_url} failed to download"
-        
-        # Should be parseable as CSV
-        csv_data = response.data.decode('utf-8')
-        try:
-            reader = csv.reader(StringIO(csv_data))
-            rows = list(reader)
-            assert len(rows) >= 1, f"{report_url} has no data"
-        except csv.Error as e:
-            pytest.fail(f"{report_url} is not valid CSV: {e}")
+    # Should be parseable as CSV with at least a header row; stream the
+    # body line by line so a malformed report aborts at the bad row.
+    try:
+        reader = csv.reader(_iter_lines(response))
+        headers = next(reader, None)
+        assert headers, f"{report_url} has no data"
+        for _ in reader:
+            pass
+    except csv.Error as e:
+        pytest.fail(f"{report_url} is not valid CSV: {e}")
 
 
 def test_expiring_training_report_includes_days_left(authenticated_client_admin, sample_data, app):
@@ -190,11 +229,61 @@ def test_expiring_training_report_includes_days_left(authenticated_client_admin,
         # sample_data already has a completion
         pass
     
-    response = authenticated_client_admin.get('/admin/reports/expiring30.csv')
-    
-    csv_data = response.data.decode('utf-8')
-    reader = csv.reader(StringIO(csv_data))
-    headers = next(reader)
-    
+    headers, _rows = _parsed_report(authenticated_client_admin, '/admin/reports/expiring30.csv')
+
     # Should have days_left column
-    assert 'days_left' in headers
\ No newline at end of file
+    assert {'days_left'} <= frozenset(headers)
+
+
+def test_bulk_completion_import(authenticated_client_admin, sample_engineer, sample_course, app):
+    """Test that the bulk CSV import creates completion rows."""
+    from io import BytesIO
+    from compliance.models import Completion
+
+    body = (
+        "engineer_id,course_id,date_taken\n"
+        f"{sample_engineer},{sample_course},2024-01-10\n"
+        f"{sample_engineer},{sample_course},2024-06-10\n"
+    )
+    response = authenticated_client_admin.post(
+        '/admin/completions/bulk',
+        data={'file': (BytesIO(body.encode('utf-8')), 'completions.csv')},
+        content_type='multipart/form-data',
+    )
+
+    assert response.status_code == 302
+    with app.app_context():
+        imported = Completion.query.filter_by(
+            engineer_id=sample_engineer, course_id=sample_course
+        ).all()
+        assert len(imported) == 2
+        # The bulk path must stamp due_date itself (bulk_insert_mappings
+        # skips the before_insert listener).
+        assert all(c.due_date is not None for c in imported)
+
+
+def test_bulk_engineer_import_skips_duplicates(authenticated_client_admin, sample_engineer, app):
+    """Test that the bulk engineer import inserts new rows and skips existing ones."""
+    from io import BytesIO
+    from compliance.models import Engineer
+
+    with app.app_context():
+        existing = db.session.get(Engineer, sample_engineer)
+        existing_no = existing.employee_no
+        body = (
+            "employee_no,name,email\n"
+            f"{existing_no},{existing.name},{existing.email}\n"
+            "EMP-BULK-1,Bulk One,bulk1@example.com\n"
+        )
+
+    response = authenticated_client_admin.post(
+        '/admin/engineers/bulk',
+        data={'file': (BytesIO(body.encode('utf-8')), 'engineers.csv')},
+        content_type='multipart/form-data',
+    )
+
+    assert response.status_code == 302
+    with app.app_context():
+        assert Engineer.query.filter_by(employee_no='EMP-BULK-1').count() == 1
+        # the duplicate row was skipped, not duplicated
+        assert Engineer.query.filter_by(employee_no=existing_no).count() == 1
\ No newline at end of file